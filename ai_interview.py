@@ -1,16 +1,32 @@
 import os
+import re
+import json
+import queue
 import random
+import threading
 import time
-import tempfile
 import speech_recognition as sr
-from gtts import gTTS
 from dotenv import load_dotenv
 import google.generativeai as genai
 import pygame  # Add this
 
+from interview_trace import Tracer
+from tts_cache import DEFAULT_CACHE_DIR, AudioCache
+from llm_client import Feedback, LLMBlockedError, LLMClient, LLMEmptyResponseError, build_feedback_prompt
+from interview_script import (
+    QUESTIONS, FIXED_PROMPTS, GREETING, INSTRUCTIONS, NO_SPEECH, NOT_UNDERSTOOD, TRY_DIFFERENT, CLOSING,
+    FALLBACK_TRANSITION, BLOCKED_RESPONSE, EMPTY_RESPONSE, UNPARSED_RESPONSE, AI_ERROR, NEXT_QUESTION,
+    feedback_turn, split_sentences,
+)
+from speech_stream import MicrophoneSource, StreamingListener, WavFileSource, make_backend
+
 # --- Configuration ---
 load_dotenv() # Load environment variables from .env file
 
+# Per-stage timings of the session; written as a Chrome trace when the interview ends
+tracer = Tracer()
+TRACE_PATH = os.getenv("INTERVIEW_TRACE_PATH", "interview_trace.json")
+
 # Configure Google AI (Gemini)
 try:
     GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
@@ -19,84 +35,147 @@ try:
     genai.configure(api_key=GOOGLE_API_KEY)
     # Select the Gemini model (e.g., 'gemini-pro')
     ai_model = genai.GenerativeModel('gemini-pro')
+    llm = LLMClient(
+        ai_model,
+        deadline_s=float(os.getenv("LLM_DEADLINE_S", "20")),
+        hedge_after_s=float(os.getenv("LLM_HEDGE_AFTER_S", "5")),
+        tracer=tracer,
+    )
     print("Google AI SDK Configured.")
     USE_AI_FEEDBACK = True
 except Exception as e:
     print(f"ERROR: Failed to configure Google AI SDK: {e}")
     print("AI feedback and follow-up questions will be disabled.")
     ai_model = None
+    llm = None
     USE_AI_FEEDBACK = False
 
-# --- Interview Questions ---
-# Add more diverse questions (behavioral, technical, situational)
-QUESTIONS = [
-    {"text": "Tell me about yourself.", "type": "General", "format": None},
-    {"text": "What are your biggest strengths?", "type": "General", "format": None},
-    {"text": "What are your biggest weaknesses?", "type": "General", "format": None},
-    {"text": "Describe a challenging project you worked on and how you handled it. Please use the STAR method.", "type": "Behavioral", "format": "STAR"},
-    {"text": "Where do you see yourself in 5 years?", "type": "General", "format": None},
-    {"text": "Why are you interested in this type of role?", "type": "General", "format": None},
-    {"text": "Tell me about a time you had a conflict with a coworker.", "type": "Behavioral", "format": None},
-    {"text": "Explain the difference between a list and a tuple in Python.", "type": "Technical", "format": None},
-    {"text": "What is Object-Oriented Programming?", "type": "Technical", "format": None},
-]
+# --- Audio ---
+audio_cache = AudioCache(
+    cache_dir=os.getenv("TTS_CACHE_DIR", DEFAULT_CACHE_DIR),
+    max_bytes=int(os.getenv("TTS_CACHE_MAX_MB", "200")) * 1024 * 1024,
+    lang=os.getenv("TTS_LANG", "en"),
+    tld=os.getenv("TTS_VOICE", "com"),
+)
+_mixer_ready = False
+
+
+def ensure_mixer():
+    """Initializes the pygame mixer once per process instead of on every utterance."""
+    global _mixer_ready
+    if not _mixer_ready:
+        pygame.mixer.init()
+        _mixer_ready = True
+
+
+def warm_up():
+    """Starts pre-synthesizing all questions and fixed prompts in the background."""
+    for text in FIXED_PROMPTS + [q["text"] for q in QUESTIONS]:
+        audio_cache.prefetch(split_sentences(text))
 
 # --- Helper Functions ---
 
-def speak(text):
-    """Converts text to speech and plays it using gTTS and pygame."""
-    if not text:
-        return
-    try:
+class SpeechPipeline:
+    """Plays queued sentences in order on one thread while later ones are still synthesizing.
+
+    ``say`` returns immediately: synthesis of every sentence starts at once through the
+    audio cache, and the playback thread plays each sentence as soon as it and all the
+    ones before it are ready.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        threading.Thread(target=self._play_loop, name="playback", daemon=True).start()
+
+    def say(self, text):
+        if not text:
+            return
         print(f"\nAI Interviewer: {text}")
-        tts = gTTS(text=text, lang='en', slow=False)
+        for sentence in split_sentences(text):
+            self._queue.put(audio_cache.fetch(sentence))
+
+    def wait(self):
+        """Blocks until everything queued so far has been played."""
+        self._queue.join()
+
+    def _play_loop(self):
+        while True:
+            audio = self._queue.get()
+            try:
+                with tracer.span("tts.synthesize"):  # ~0 on a cache hit
+                    path = audio.result()
+                with tracer.span("tts.play"):
+                    ensure_mixer()
+                    pygame.mixer.music.load(path)
+                    pygame.mixer.music.play()
+                    while pygame.mixer.music.get_busy():
+                        pygame.time.Clock().tick(50)
+                    pygame.mixer.music.unload()
+            except Exception as e:
+                print(f"Error during text-to-speech: {e}")
+                print(" ---> (Speaking skipped)")
+            finally:
+                self._queue.task_done()
+
+
+speech = SpeechPipeline()
 
-        with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as fp:
-            temp_filename = fp.name
-        tts.save(temp_filename)
 
-        # Initialize and play with pygame
-        pygame.mixer.init()
-        pygame.mixer.music.load(temp_filename)
-        pygame.mixer.music.play()
+def speak(text):
+    """Speaks ``text`` and returns once it has been played."""
+    # Earlier sentences (e.g. feedback) may still be playing; that wait is not this text's latency
+    with tracer.span("speak.backlog"):
+        speech.wait()
+    with tracer.span("speak"):
+        speech.say(text)
+        speech.wait()
+
+_listener = None
 
-        while pygame.mixer.music.get_busy():
-            pygame.time.Clock().tick(10)
 
-        os.remove(temp_filename)
-        time.sleep(0.5)
+def get_listener():
+    """Returns the session's StreamingListener; see ``calibrate_listener`` for its noise floor.
 
+    SPEECH_BACKEND selects "google" (default, online) or "vosk" (offline, needs VOSK_MODEL_PATH).
+    """
+    global _listener
+    if _listener is None:
+        backend_name = os.getenv("SPEECH_BACKEND", "google")
+        options = {"model_path": os.getenv("VOSK_MODEL_PATH")} if backend_name == "vosk" else {}
+        _listener = StreamingListener(
+            make_backend(backend_name, **options),
+            pause_ms=1200,  # Slightly longer pause allowed
+            timeout_s=7,  # 7s silence timeout
+            phrase_limit_s=45,  # 45s max phrase
+            tracer=tracer,
+        )
+    return _listener
+
+
+def calibrate_listener():
+    """Measures the room's noise floor before anyone speaks; every turn reuses it."""
+    try:
+        with MicrophoneSource() as source:
+            threshold = get_listener().calibrate_source(source)
+        print(f"Speech threshold: {threshold:.0f}")
     except Exception as e:
-        print(f"Error during text-to-speech: {e}")
-        print(" ---> (Speaking skipped)")
-
-def listen():
-    """Listens via microphone and returns recognized text."""
-    r = sr.Recognizer()
-    with sr.Microphone() as source:
-        print("\nListening...")
-        r.pause_threshold = 1.2 # Slightly longer pause allowed
-        r.energy_threshold = 400 # Adjust if recognition is too sensitive/insensitive
-        # Listen for the first phrase and extract it into audio data
-        try:
-            # Adjust for ambient noise dynamically
-            r.adjust_for_ambient_noise(source, duration=0.5)
-            audio = r.listen(source, timeout=7, phrase_time_limit=45) # 7s silence timeout, 45s max phrase
-        except sr.WaitTimeoutError:
-            speak("I didn't hear anything. Let's move on.")
-            return None
-        except Exception as e:
-            print(f"Error obtaining audio: {e}")
-            return None
-
-    # Recognize speech using Google Web Speech API (requires internet)
+        print(f"Microphone calibration skipped: {e}")
+
+
+def listen(wav_path=None):
+    """Listens via microphone (or reads ``wav_path``) and returns recognized text."""
+    source = WavFileSource(wav_path) if wav_path else MicrophoneSource()
+    print("\nListening...")
     try:
-        print("Recognizing...")
-        text = r.recognize_google(audio)
+        with tracer.span("listen"), source:
+            text = get_listener().listen(source, on_partial=lambda partial: print(f"  ...{partial}"))
         print(f"You: {text}")
         return text
+    except sr.WaitTimeoutError:
+        speak(NO_SPEECH)
+        return None
     except sr.UnknownValueError:
-        speak("Sorry, I couldn't understand that.")
+        speak(NOT_UNDERSTOOD)
         return None
     except sr.RequestError as e:
         speak(f"Could not request results from the speech recognition service. {e}")
@@ -107,101 +186,178 @@ def listen():
 
 def get_ai_feedback_and_followup(question_data, answer):
     """Gets feedback and a follow-up question from Google Gemini."""
-    if not USE_AI_FEEDBACK or not ai_model or not answer:
+    if not USE_AI_FEEDBACK or not llm or not answer:
         print("--> Skipping AI feedback generation.")
         # Provide a generic transition if AI is off or answer is missing
-        return "Okay, let's proceed.", None
-
-    question_text = question_data['text']
-    question_type = question_data['type']
-    expected_format = question_data['format']
-
-    prompt = f"""
-    You are an expert AI Mock Interviewer. Your tone is professional and encouraging.
-    The candidate was asked the following '{question_type}' question:
-    "{question_text}"
-
-    The candidate provided this answer:
-    "{answer}"
-    """
-
-    if expected_format == "STAR":
-        prompt += f"\nEvaluate the answer based on the STAR method (Situation, Task, Action, Result). Note if elements seem missing or could be clearer."
-    elif question_type == "Technical":
-        prompt += f"\nEvaluate the technical accuracy, depth, and clarity of the explanation."
-    else: # General/Behavioral without specific format
-        prompt += f"\nEvaluate the clarity, relevance, and impact of the answer."
-
-    prompt += """
-
-    Provide concise, constructive feedback (1-3 sentences). Start the feedback with "Feedback:".
-    Then, ask ONE relevant follow-up question to probe deeper into their answer or explore a related area. Start the follow-up question with "Follow-up:". If the answer is too brief or vague for a specific follow-up, ask a related standard question within the same '{question_type}' category.
-
-    Ensure your entire response contains ONLY the "Feedback:" line and the "Follow-up:" line.
-    Example:
-    Feedback: That's a good start, but perhaps you could elaborate more on the specific results of your actions.
-    Follow-up: Can you quantify the impact your contribution had on the project's success?
-    """
+        return FALLBACK_TRANSITION, None
 
     print("--> Asking Gemini for feedback...")
-    try:
-        # Generate content using the Gemini model
-        response = ai_model.generate_content(prompt)
-
-        # Basic check for blocked content (can refine with safety settings)
-        if not response.candidates or not response.candidates[0].content.parts:
-             if response.prompt_feedback.block_reason:
-                 print(f"WARN: Gemini response blocked due to: {response.prompt_feedback.block_reason}")
-                 return "My response was blocked due to safety settings. Let's move to the next question.", None
-             else:
-                 print("WARN: Gemini returned an empty response.")
-                 return "I couldn't generate feedback for that response. Let's continue.", None
+    return feedback_turn(llm, question_data, answer)
 
 
-        content = response.text
-        # print(f"DEBUG: Raw Gemini Response:\n{content}") # Uncomment for debugging
+class FeedbackStreamParser:
+    """Parses the feedback response incrementally while it streams in.
 
-        # --- Parse the response ---
-        feedback = "Okay." # Default feedback
-        follow_up = None # Default no follow-up
+    The response is either the JSON object ``{"feedback": ..., "follow_up": ...}`` or the
+    "Feedback:" / "Follow-up:" line format. Complete feedback sentences go to
+    ``on_sentence`` as soon as the next one starts (or the value ends); the follow-up goes
+    to ``on_follow_up`` once it is complete.
+    """
 
-        lines = content.strip().split('\n')
-        found_feedback = False
-        found_followup = False
+    # A JSON string value, possibly still open; a trailing partial escape is left for later
+    _JSON_FIELD = r'"{}"\s*:\s*"((?:[^"\\]|\\.)*)(")?'
+
+    def __init__(self, on_sentence, on_follow_up=None):
+        self.on_sentence = on_sentence
+        self.on_follow_up = on_follow_up
+        self.feedback = None
+        self.follow_up = None
+        self._text = ""
+        self._buffer = ""
+        self._spoken = 0  # feedback sentences already handed to on_sentence
+
+    @property
+    def spoken(self):
+        """Number of feedback sentences already handed to ``on_sentence``."""
+        return self._spoken
+
+    @property
+    def is_json(self):
+        return self._text.lstrip()[:1] in ("{", "`")
+
+    def feed(self, text):
+        self._text += text
+        if self.is_json:
+            self._handle_json(complete=False)
+            return
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split("\n")
         for line in lines:
-            line_lower = line.lower()
-            if line_lower.startswith("feedback:") and not found_feedback:
-                feedback = line.split(":", 1)[1].strip()
-                found_feedback = True
-            elif line_lower.startswith("follow-up:") or line_lower.startswith("follow up:") and not found_followup:
-                 # Handle potential variations like "Follow up:"
-                follow_up = line.split(":", 1)[1].strip()
-                found_followup = True
-
-        # If parsing failed somehow, use generic transition
-        if not found_feedback and not found_followup and len(content) > 10:
-             print("WARN: Could not parse feedback/follow-up structure from Gemini response. Using generic transition.")
-             feedback = "Interesting. Let's move on to the next topic."
-             follow_up = None # Ensure no accidental follow-up
-        elif not follow_up:
-             # If feedback was found but no follow-up, create a transition
-             feedback += " Let's move to the next question."
-
-        return feedback, follow_up
-
+            self._handle(line, complete=True)
+        self._handle(self._buffer, complete=False)
+
+    def close(self):
+        if self.is_json:
+            self._handle_json(complete=True)
+            return
+        self._handle(self._buffer, complete=True)
+        self._buffer = ""
+
+    def _handle_json(self, complete):
+        for key in ("feedback", "follow_up"):
+            match = re.search(self._JSON_FIELD.format(key), self._text)
+            if match is None:
+                continue
+            try:
+                value = json.loads(f'"{match.group(1)}"')
+            except ValueError:
+                continue  # cut inside a \u escape; the next chunk completes it
+            self._field(key, value.strip(), complete or match.group(2) is not None)
+
+    def _handle(self, line, complete):
+        key, _, body = line.partition(":")
+        self._field(key.strip(" *").lower(), body.strip(" *"), complete)
+
+    def _field(self, key, body, complete):
+        if key == "feedback" and self.feedback is None:
+            sentences = split_sentences(body)
+            if not complete:
+                sentences = sentences[:-1]  # the last sentence may still be growing
+            for sentence in sentences[self._spoken:]:
+                self.on_sentence(sentence)
+            self._spoken = max(self._spoken, len(sentences))
+            if complete:
+                self.feedback = body
+        elif key in ("follow-up", "follow up", "follow_up") and complete and body and self.follow_up is None:
+            self.follow_up = body
+            if self.on_follow_up:
+                self.on_follow_up(body)
+
+
+def stream_ai_feedback_and_followup(question_data, answer, on_sentence, on_follow_up=None):
+    """Like ``get_ai_feedback_and_followup``, but streams the Gemini response.
+
+    The same structured JSON prompt is used, and LLMClient applies its deadline and
+    retries to the stream. Feedback sentences are passed to ``on_sentence`` while the model is still writing,
+    and everything else the interviewer should say next (fallbacks and transitions) goes
+    through ``on_sentence`` too. Returns ``(feedback, follow_up)``.
+    """
+    if not USE_AI_FEEDBACK or not llm or not answer:
+        print("--> Skipping AI feedback generation.")
+        on_sentence(FALLBACK_TRANSITION)
+        return FALLBACK_TRANSITION, None
+
+    cache_key = llm.cache_key(question_data, answer)
+    cached = llm.cached(cache_key)
+    if cached is not None:
+        for sentence in split_sentences(cached.feedback):
+            on_sentence(sentence)
+        if cached.follow_up is None:
+            on_sentence(NEXT_QUESTION)
+            return f"{cached.feedback} {NEXT_QUESTION}", None
+        if on_follow_up:
+            on_follow_up(cached.follow_up)
+        return cached.feedback, cached.follow_up
+
+    print("--> Streaming feedback from Gemini...")
+    parser = FeedbackStreamParser(on_sentence, on_follow_up)
+    start = time.perf_counter()
+    first_chunk = None
+    parse_seconds = 0.0
+    completed = False
+    try:
+        with tracer.span("llm"):
+            for text in llm.stream(
+                build_feedback_prompt(question_data, answer, structured=True),
+                generation_config={"response_mime_type": "application/json"},
+            ):
+                fed = time.perf_counter()
+                if first_chunk is None:
+                    first_chunk = fed
+                    tracer.record("llm.first_chunk", start, fed)
+                parser.feed(text)
+                parse_seconds += time.perf_counter() - fed
+            parser.close()
+            completed = True
     except Exception as e:
-        print(f"ERROR interacting with Google AI: {e}")
-        return "I encountered an error processing that. Let's move to the next question.", None
+        if isinstance(e, LLMBlockedError):
+            print(f"WARN: Gemini response blocked due to: {e}")
+            fallback = BLOCKED_RESPONSE
+        elif isinstance(e, LLMEmptyResponseError):
+            print("WARN: Gemini returned an empty response.")
+            fallback = EMPTY_RESPONSE
+        else:
+            print(f"ERROR interacting with Google AI: {e}")
+            fallback = AI_ERROR
+        # Once feedback has been spoken, keep it and carry on instead of apologizing
+        if parser.feedback is None and not parser.spoken:
+            on_sentence(fallback)
+            return fallback, None
+    finally:
+        # Parsing is interleaved with the stream; report its total as one span
+        tracer.record("parse", start, start + parse_seconds)
+
+    if parser.feedback is None and parser.follow_up is None:
+        print("WARN: Could not parse feedback/follow-up structure from Gemini response. Using generic transition.")
+        on_sentence(UNPARSED_RESPONSE)
+        return UNPARSED_RESPONSE, None
+    feedback = parser.feedback or "Okay."
+    if completed:  # a stream cut off partway must not be replayed from the cache
+        llm.remember(cache_key, Feedback(feedback, parser.follow_up))
+    if parser.follow_up is None:
+        on_sentence(NEXT_QUESTION)
+        return f"{feedback} {NEXT_QUESTION}", None
+    return feedback, parser.follow_up
 
 
 # --- Main Interview Loop ---
 
 def run_interview():
     """Runs the main mock interview flow in the terminal."""
-    speak("Hello! Welcome to your AI-powered mock interview.")
-    time.sleep(0.5)
-    speak("I will ask you a series of questions. Please answer clearly after the beep sound would normally be... just kidding, answer after I stop talking.")
-    time.sleep(1)
+    warm_up()
+    calibrate_listener()  # before the greeting, so its playback is not mistaken for noise
+    speech.say(GREETING)
+    speech.say(INSTRUCTIONS)
 
     # Select a subset of questions for this session
     num_questions = min(len(QUESTIONS), 5) # Ask up to 5 base questions
@@ -218,18 +374,27 @@ def run_interview():
                 # Should not happen if loop condition is correct, but safety break
                  break
 
-        # Ask the question (either original or follow-up)
+        turn_start = time.perf_counter()
+
+        # Ask the question (either original or follow-up); it has to finish before we listen
         speak(current_question_data['text'])
 
         # Get user's answer
         answer = listen()
 
         if answer:
-            # Get feedback and potential follow-up from AI
-            feedback_text, follow_up_text = get_ai_feedback_and_followup(current_question_data, answer)
-
-            # Deliver feedback
-            speak(feedback_text)
+            # Prepare the next deck question's audio while Gemini is still thinking
+            if question_index + 1 < len(interview_deck):
+                audio_cache.prefetch(split_sentences(interview_deck[question_index + 1]['text']))
+
+            # Feedback sentences start playing while the rest of the response streams in,
+            # and a follow-up is synthesized as soon as its line arrives
+            feedback_text, follow_up_text = stream_ai_feedback_and_followup(
+                current_question_data,
+                answer,
+                on_sentence=speech.say,
+                on_follow_up=lambda text: audio_cache.prefetch(split_sentences(text)),
+            )
 
             # Prepare for next iteration
             if follow_up_text:
@@ -248,13 +413,24 @@ def run_interview():
         else:
             # If listen() failed or returned None (e.g., timeout, unintelligible)
             # Move to the next question in the deck without feedback
-            speak("Okay, let's try a different question then.")
+            speech.say(TRY_DIFFERENT)
             current_question_data = None
             question_index += 1
 
-        time.sleep(1) # Pause before the next interaction
+        # Feedback may still be playing; the next turn's "speak" waits for it
+        tracer.record("turn", turn_start, time.perf_counter(), answered=bool(answer))
+
+    speak(CLOSING)
+    report_trace()
+
 
-    speak("That concludes our mock interview session. Thank you for participating! Remember to reflect on the feedback.")
+def report_trace():
+    """Prints p50/p95 per stage and writes the session's Chrome trace to TRACE_PATH."""
+    print("\n--- Latency by stage ---")
+    print(tracer.format_summary())
+    if TRACE_PATH:
+        tracer.export(TRACE_PATH)
+        print(f"Trace written to {TRACE_PATH} (open it in chrome://tracing or https://ui.perfetto.dev)")
 
 if __name__ == "__main__":
     run_interview()
\ No newline at end of file
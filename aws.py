@@ -1,5 +1,15 @@
 import os
+import json
+import time
+import hashlib
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Iterable, Optional
+
 import boto3
+from boto3.s3.transfer import TransferConfig
+
+from url_cache import SignedURLCache
 
 
 bucket_name = os.getenv("AWS_BUCKET_NAME")
@@ -7,58 +17,399 @@ AWS_ACCESS_KEY = os.getenv("AWS_ACCESS_KEY")
 AWS_SECRET_KEY = os.getenv("AWS_SECRET_KEY")
 AWS_REGION = os.getenv("AWS_REGION")
 
+MIN_PART_SIZE = 5 * 1024 * 1024  # S3 rejects smaller parts (except the last one)
+MAX_PARTS = 10000  # S3's limit on parts per multipart upload
+DEFAULT_PART_SIZE = 64 * 1024 * 1024
+DEFAULT_MAX_CONCURRENCY = 8
+SYNC_PART_SIZE = 8 * 1024 * 1024  # boto3's default chunk size, so upload_to_s3 objects compare equal
+MANIFEST_SUFFIX = ".s3upload"
+# Bookkeeping written next to the files being uploaded; sync_directory never uploads it
+SYNC_IGNORED_SUFFIXES = (MANIFEST_SUFFIX, MANIFEST_SUFFIX + ".tmp")
+
+
+@dataclass
+class UploadResult:
+    bucket: str
+    key: str
+    size: int
+    part_size: int
+    parts_total: int
+    parts_uploaded: int
+    parts_resumed: int
+    bytes_sent: int
+    elapsed: float
+    etag: Optional[str] = None
+
+    @property
+    def throughput(self) -> float:
+        """Bytes per second sent during this run (resumed parts excluded)."""
+        return self.bytes_sent / self.elapsed if self.elapsed else 0.0
+
+
+@dataclass
+class SyncResult:
+    files_uploaded: int = 0
+    files_skipped: int = 0
+    files_deleted: int = 0
+    bytes_transferred: int = 0
+    bytes_skipped: int = 0
+    elapsed: float = 0.0
+    errors: list = field(default_factory=list)  # (path or key, error message)
+
+
+@dataclass
+class _UploadManifest:
+    path: str
+    upload_id: str
+    size: int
+    mtime: float
+    part_size: int
+    parts: dict = field(default_factory=dict)  # part number -> ETag
+    bucket: str = ""  # where the multipart upload lives, so it can be aborted
+    key: str = ""
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path) as fp:
+                data = json.load(fp)
+        except (OSError, ValueError):
+            return None
+        data["parts"] = {int(k): v for k, v in data.get("parts", {}).items()}
+        return cls(path=path, **data)
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as fp:
+            json.dump({
+                "upload_id": self.upload_id,
+                "size": self.size,
+                "mtime": self.mtime,
+                "part_size": self.part_size,
+                "parts": self.parts,
+                "bucket": self.bucket,
+                "key": self.key,
+            }, fp)
+        os.replace(tmp_path, self.path)
+
+
+def _file_md5s(path, part_size):
+    """Returns one MD5 per ``part_size`` block of the file."""
+    digests = []
+    with open(path, "rb") as fp:
+        while True:
+            digest = hashlib.md5()
+            remaining = part_size
+            while remaining:
+                chunk = fp.read(min(remaining, 1024 * 1024))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                remaining -= len(chunk)
+            if remaining == part_size and digests:
+                break
+            digests.append(digest)
+            if remaining:
+                break
+    return digests
+
+
 class AWS:
-    def __init__(self):
+    def __init__(self, bucket: Optional[str] = None):
         self.s3_client = boto3.client(
             "s3",
             aws_access_key_id=AWS_ACCESS_KEY,
             aws_secret_access_key=AWS_SECRET_KEY,
             region_name=AWS_REGION
         )
+        self.bucket_name = bucket or bucket_name
+        self.url_cache = SignedURLCache()
 
     def upload_to_s3(self, file_path, object_name=None):
         if object_name is None:
             object_name = file_path.split("/")[-1]
         
         try:
-            self.s3_client.upload_file(file_path, bucket_name, object_name)
-            print(f"File '{file_path}' uploaded successfully to '{bucket_name}/{object_name}'.")
+            self.s3_client.upload_file(file_path, self.bucket_name, object_name)
+            print(f"File '{file_path}' uploaded successfully to '{self.bucket_name}/{object_name}'.")
         except Exception as e:
             print(f"Error uploading file: {e}")
 
+    def upload_large_file(
+        self,
+        file_path: str,
+        object_name: Optional[str] = None,
+        part_size: int = DEFAULT_PART_SIZE,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        manifest_path: Optional[str] = None,
+        progress: Optional[Callable[[int, int], None]] = None,
+    ) -> UploadResult:
+        """Uploads a file with a parallel multipart upload that can resume after an interruption.
+
+        Completed parts are recorded in a JSON manifest (``<file>.s3upload`` by default).
+        Calling this again with the same file and key skips the parts already stored in S3.
+        ``progress`` is called with ``(bytes_done, total_bytes)`` after each part.
+        ``part_size`` is raised when needed to stay within S3's limit of 10,000 parts.
+        """
+        if object_name is None:
+            object_name = os.path.basename(file_path)
+        if manifest_path is None:
+            manifest_path = file_path + MANIFEST_SUFFIX
+
+        stat = os.stat(file_path)
+        manifest = _UploadManifest.load(manifest_path)
+        if manifest is not None:
+            # Manifests written before bucket and key were recorded belong to this target
+            bucket, key = manifest.bucket or self.bucket_name, manifest.key or object_name
+            if (bucket, key) != (self.bucket_name, object_name) or (manifest.size, manifest.mtime) != (stat.st_size, stat.st_mtime):
+                # A different target, or the file changed since the interrupted run: the
+                # stored parts are useless, and would keep costing storage until aborted.
+                self._abort_multipart(key, manifest.upload_id, bucket)
+                manifest = None
+        if manifest is not None:
+            manifest.parts = self._confirmed_parts(object_name, manifest)
+            if manifest.parts is None:
+                manifest = None
+        if manifest is None:
+            part_size = max(part_size, MIN_PART_SIZE, -(-stat.st_size // MAX_PARTS))
+            upload = self.s3_client.create_multipart_upload(Bucket=self.bucket_name, Key=object_name)
+            manifest = _UploadManifest(
+                manifest_path, upload["UploadId"], stat.st_size, stat.st_mtime, part_size,
+                bucket=self.bucket_name, key=object_name,
+            )
+            manifest.save()
+
+        part_size = manifest.part_size
+        parts_total = max(1, -(-stat.st_size // part_size))
+        pending = [n for n in range(1, parts_total + 1) if n not in manifest.parts]
+        parts_resumed = parts_total - len(pending)
+        bytes_done = sum(self._part_length(n, part_size, stat.st_size) for n in manifest.parts)
+
+        def upload_part(part_number):
+            offset = (part_number - 1) * part_size
+            length = self._part_length(part_number, part_size, stat.st_size)
+            with open(file_path, "rb") as fp:
+                fp.seek(offset)
+                body = fp.read(length)
+            response = self.s3_client.upload_part(
+                Bucket=self.bucket_name,
+                Key=object_name,
+                UploadId=manifest.upload_id,
+                PartNumber=part_number,
+                Body=body,
+            )
+            return part_number, length, response["ETag"]
+
+        bytes_sent = 0
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+            futures = [executor.submit(upload_part, n) for n in pending]
+            for future in as_completed(futures):
+                part_number, length, etag = future.result()
+                manifest.parts[part_number] = etag
+                manifest.save()
+                bytes_done += length
+                bytes_sent += length
+                if progress:
+                    progress(bytes_done, stat.st_size)
+
+        response = self.s3_client.complete_multipart_upload(
+            Bucket=self.bucket_name,
+            Key=object_name,
+            UploadId=manifest.upload_id,
+            MultipartUpload={"Parts": [
+                {"PartNumber": n, "ETag": manifest.parts[n]} for n in sorted(manifest.parts)
+            ]},
+        )
+        elapsed = time.monotonic() - start
+        os.remove(manifest_path)
+
+        return UploadResult(
+            bucket=self.bucket_name,
+            key=object_name,
+            size=stat.st_size,
+            part_size=part_size,
+            parts_total=parts_total,
+            parts_uploaded=len(pending),
+            parts_resumed=parts_resumed,
+            bytes_sent=bytes_sent,
+            elapsed=elapsed,
+            etag=response.get("ETag"),
+        )
+
+    @staticmethod
+    def _part_length(part_number, part_size, size):
+        return max(0, min(part_size, size - (part_number - 1) * part_size))
+
+    def _confirmed_parts(self, object_name, manifest):
+        """Returns the manifest parts S3 still holds, or None if the upload is gone."""
+        stored = {}
+        try:
+            paginator = self.s3_client.get_paginator("list_parts")
+            for page in paginator.paginate(Bucket=self.bucket_name, Key=object_name, UploadId=manifest.upload_id):
+                for part in page.get("Parts", []):
+                    stored[part["PartNumber"]] = part["ETag"]
+        except self.s3_client.exceptions.NoSuchUpload:
+            return None
+        return {n: etag for n, etag in manifest.parts.items() if stored.get(n) == etag}
+
+    def _abort_multipart(self, object_name, upload_id, bucket=None):
+        try:
+            self.s3_client.abort_multipart_upload(Bucket=bucket or self.bucket_name, Key=object_name, UploadId=upload_id)
+        except self.s3_client.exceptions.NoSuchUpload:
+            pass
+
+    def sync_directory(
+        self,
+        local_dir: str,
+        prefix: str = "",
+        delete: bool = False,
+        max_workers: int = DEFAULT_MAX_CONCURRENCY,
+        part_size: int = SYNC_PART_SIZE,
+        allow_empty_source: bool = False,
+    ) -> SyncResult:
+        """Uploads only the files under ``local_dir`` that are missing or different under ``prefix``.
+
+        Files are compared with the remote listing by size and then by ETag, which is the MD5
+        of the content for single-part uploads and the MD5 of the part MD5s for multipart ones.
+        Resume manifests of ``upload_large_file`` (``*.s3upload``) are skipped.
+        With ``delete=True`` remote objects under ``prefix`` that have no local file are removed;
+        an empty ``local_dir`` raises instead of emptying the prefix unless ``allow_empty_source=True``.
+        """
+        if not os.path.isdir(local_dir):
+            raise NotADirectoryError(f"Not a directory: {local_dir}")
+        if prefix and not prefix.endswith("/"):
+            prefix += "/"
+        start = time.monotonic()
+        result = SyncResult()
+        remote = self._list_objects(prefix)
+
+        local = {}
+        for root, _, files in os.walk(local_dir):
+            for name in files:
+                if name.endswith(SYNC_IGNORED_SUFFIXES):
+                    continue
+                path = os.path.join(root, name)
+                rel_path = os.path.relpath(path, local_dir).replace(os.sep, "/")
+                local[prefix + rel_path] = path
+        if delete and not local and not allow_empty_source:
+            raise ValueError(f"{local_dir} has no files; pass allow_empty_source=True to delete everything under '{prefix}'")
+
+        config = TransferConfig(
+            multipart_threshold=part_size,
+            multipart_chunksize=part_size,
+            max_concurrency=1,  # parallelism comes from the file-level pool below
+        )
+
+        def sync_file(key, path):
+            size = os.path.getsize(path)
+            obj = remote.get(key)
+            if obj is not None and obj["Size"] == size and self._etag_matches(path, size, obj["ETag"], part_size):
+                return False, size
+            self.s3_client.upload_file(path, self.bucket_name, key, Config=config)
+            return True, size
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futures = {executor.submit(sync_file, key, path): path for key, path in local.items()}
+            for future in as_completed(futures):
+                try:
+                    uploaded, size = future.result()
+                except Exception as e:
+                    result.errors.append((futures[future], str(e)))
+                    continue
+                if uploaded:
+                    result.files_uploaded += 1
+                    result.bytes_transferred += size
+                else:
+                    result.files_skipped += 1
+                    result.bytes_skipped += size
+
+        if delete:
+            orphans = sorted(set(remote) - set(local))
+            for i in range(0, len(orphans), 1000):  # DeleteObjects takes at most 1000 keys
+                response = self.s3_client.delete_objects(
+                    Bucket=self.bucket_name,
+                    Delete={"Objects": [{"Key": key} for key in orphans[i:i + 1000]], "Quiet": True},
+                )
+                errors = response.get("Errors", [])
+                result.errors.extend((error["Key"], error.get("Message", "")) for error in errors)
+                result.files_deleted += len(orphans[i:i + 1000]) - len(errors)
+
+        result.elapsed = time.monotonic() - start
+        return result
+
+    def _list_objects(self, prefix):
+        objects = {}
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                objects[obj["Key"]] = obj
+        return objects
+
+    @staticmethod
+    def _etag_matches(path, size, etag, part_size):
+        etag = etag.strip('"')
+        if "-" not in etag:
+            return _file_md5s(path, size or 1)[0].hexdigest() == etag
+        parts = int(etag.rsplit("-", 1)[1])
+        # The part size is not stored with the object; try the sizes this class uploads with.
+        for candidate in (part_size, SYNC_PART_SIZE, DEFAULT_PART_SIZE):
+            if -(-size // candidate) == parts:
+                digests = _file_md5s(path, candidate)
+                combined = hashlib.md5(b"".join(d.digest() for d in digests))
+                if f"{combined.hexdigest()}-{parts}" == etag:
+                    return True
+        return False
+
     def generate_signed_url(self, object_name, expiration=3600):
         try:
-            url = self.s3_client.generate_presigned_url(
-                'get_object',
-                Params={'Bucket': bucket_name, 'Key': object_name},
-                ExpiresIn=expiration
-            )
-            print("Signed URL:", url)
-            return url
+            return self._presign(object_name, expiration)
         except Exception as e:
             print(f"Error generating signed URL: {e}")
 
     def generate_presigned_url(self, object_name, expiration=3600):
         try:
-            url = self.s3_client.generate_presigned_url(
-                'get_object',
-                Params={
-                    'Bucket': bucket_name,
-                    'Key': object_name,
-                    'ResponseContentType': 'video/mp4',  # Ensure it's recognized as a video
-                    'ResponseContentDisposition': 'inline'  # Forces streaming instead of downloading
-                },
-                ExpiresIn=expiration
-            )
-            print("Signed URL:", url)
-            return url
+            # video/mp4 + inline makes browsers stream the video instead of downloading it
+            return self._presign(object_name, expiration, "video/mp4", "inline")
         except Exception as e:
             print(f"Error generating signed URL: {e}")
 
+    def generate_presigned_urls(
+        self,
+        object_names: Iterable[str],
+        expiration: int = 3600,
+        content_type: Optional[str] = None,
+        content_disposition: Optional[str] = None,
+    ) -> dict:
+        """Returns ``{object_name: url}`` for many objects, reusing cached URLs that are still valid.
+
+        ``content_type`` and ``content_disposition`` become the ``ResponseContentType`` and
+        ``ResponseContentDisposition`` overrides of every URL in the batch.
+        """
+        return {
+            name: self._presign(name, expiration, content_type, content_disposition)
+            for name in object_names
+        }
+
+    def _presign(self, object_name, expiration, content_type=None, content_disposition=None):
+        params = {'Bucket': self.bucket_name, 'Key': object_name}
+        if content_type:
+            params['ResponseContentType'] = content_type
+        if content_disposition:
+            params['ResponseContentDisposition'] = content_disposition
+        cache_key = (self.bucket_name, object_name, expiration, content_type, content_disposition)
+        return self.url_cache.get_or_sign(
+            cache_key,
+            expiration,
+            lambda: self.s3_client.generate_presigned_url('get_object', Params=params, ExpiresIn=expiration),
+        )
 
 if __name__ == "__main__":
     aws = AWS()
     # aws.upload_to_s3("/home/mothilal/Downloads/Java For Programmers in 2 hours - Telusko (720p, h264) (1).mp4", "java-video.mp4")
-    # aws.generate_signed_url("java-video.mp4")
-    aws.generate_presigned_url("java-video.mp4")
-
+    # result = aws.upload_large_file("/home/mothilal/Downloads/course.mp4", "course.mp4", progress=lambda done, total: print(f"{done}/{total} bytes"))
+    # print(f"Uploaded {result.size} bytes in {result.elapsed:.1f}s ({result.throughput / 1e6:.1f} MB/s)")
+    # print(aws.sync_directory("/home/mothilal/courses/333", "courses/333", delete=True))
+    # print("Signed URL:", aws.generate_signed_url("java-video.mp4"))
+    print("Signed URL:", aws.generate_presigned_url("java-video.mp4"))
+    # print(aws.generate_presigned_urls(["java-video.mp4", "react-video.mp4"], content_type="video/mp4", content_disposition="inline"))
@@ -0,0 +1,150 @@
+"""Benchmarks FakeSheet data generation and export.
+
+Each generation case runs in a fresh process so its peak RSS is its own. Results are
+written as JSON so runs can be compared across changes:
+
+    python bench_fake_sheet.py --rows 10000 100000 1000000 --output bench_fake_sheet.json
+"""
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import platform
+import tempfile
+import multiprocessing
+
+import pandas as pd
+
+from fake_sheet import COLUMNS, FakeSheet
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _prepared_sheet(engine):
+    """Returns a FakeSheet with the engine's one-off setup (value pools) already done."""
+    start = time.perf_counter()
+    sheet = FakeSheet()
+    if engine == "pool":
+        sheet.columnar
+    return sheet, time.perf_counter() - start
+
+
+def bench_generation(rows, engine):
+    """Generates ``rows`` rows and times the upload payload conversion; runs in a child process."""
+    sheet, setup_seconds = _prepared_sheet(engine)
+    start = time.perf_counter()
+    sheet.generate_data(rows, engine=engine)
+    elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    payload = [COLUMNS] + sheet.data  # what upload_to_google_sheet sends
+    payload_seconds = time.perf_counter() - start
+    del payload
+
+    # The DataFrame round trip upload_to_google_sheet used to do, for comparison.
+    start = time.perf_counter()
+    df = pd.DataFrame(sheet.data, columns=COLUMNS)
+    legacy = [df.columns.values.tolist()] + df.values.tolist()
+    dataframe_seconds = time.perf_counter() - start
+    del df, legacy
+
+    return {
+        "rows": rows,
+        "engine": engine,
+        "setup_seconds": setup_seconds,
+        "seconds": elapsed,
+        "rows_per_second": rows / elapsed if elapsed else None,
+        "email_retries": sheet.email_retries,
+        "phone_retries": sheet.phone_retries,
+        "retry_rate": (sheet.email_retries + sheet.phone_retries) / (2 * rows) if rows else 0.0,
+        "payload_conversion_seconds": payload_seconds,
+        "dataframe_conversion_seconds": dataframe_seconds,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def bench_export(rows, engine, batch_size):
+    """Streams ``rows`` rows to CSV and Parquet; runs in a child process."""
+    sheet, setup_seconds = _prepared_sheet(engine)
+    results = {"rows": rows, "engine": engine, "batch_size": batch_size, "setup_seconds": setup_seconds}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for fmt, export in (("csv", sheet.export_csv), ("parquet", sheet.export_parquet)):
+            path = os.path.join(tmp_dir, f"bench.{fmt}")
+            start = time.perf_counter()
+            export(path, rows, batch_size, engine)
+            elapsed = time.perf_counter() - start
+            results[fmt] = {
+                "seconds": elapsed,
+                "rows_per_second": rows / elapsed if elapsed else None,
+                "bytes": os.path.getsize(path),
+            }
+    results["peak_rss_mb"] = _peak_rss_mb()
+    return results
+
+
+def bench_columns(samples):
+    """Microseconds per call of each Faker provider behind one column."""
+    sheet = FakeSheet()
+    providers = {
+        "name": sheet.fake.name,
+        "email": sheet.generate_unique_email,
+        "phone": sheet.generate_unique_phone,
+        "linkedin": sheet.fake.url,
+        "company_name": sheet.fake.company,
+        "designation": sheet.fake.job,
+    }
+    costs = {}
+    for column, provider in providers.items():
+        start = time.perf_counter()
+        for _ in range(samples):
+            provider()
+        costs[column] = (time.perf_counter() - start) / samples * 1e6
+    return {"samples": samples, "microseconds_per_call": costs}
+
+
+def _run_isolated(function, *args):
+    # A fresh spawned process per case keeps ru_maxrss from leaking between cases.
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(function, args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--engines", nargs="+", default=["faker", "pool"], choices=["faker", "pool"])
+    parser.add_argument("--export-rows", type=int, default=100_000)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--column-samples", type=int, default=2_000)
+    parser.add_argument("--output", default="bench_fake_sheet.json")
+    args = parser.parse_args()
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "columns": bench_columns(args.column_samples),
+        "generation": [],
+        "export": [],
+    }
+    for engine in args.engines:
+        for rows in args.rows:
+            result = _run_isolated(bench_generation, rows, engine)
+            print(f"{engine:>6} {rows:>10,} rows: {result['rows_per_second']:>10,.0f} rows/s, "
+                  f"peak {result['peak_rss_mb']:.0f} MB, retry rate {result['retry_rate']:.4%}")
+            report["generation"].append(result)
+        report["export"].append(_run_isolated(bench_export, args.export_rows, engine, args.batch_size))
+
+    with open(args.output, "w") as fp:
+        json.dump(report, fp, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
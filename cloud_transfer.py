@@ -0,0 +1,158 @@
+import time
+import base64
+import hashlib
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional
+
+import google_crc32c
+
+from aws import AWS, MAX_PARTS, MIN_PART_SIZE
+from gcp import GCP
+
+DEFAULT_BUFFER_SIZE = 8 * 1024 * 1024  # >= the S3 minimum part and a multiple of 256 KiB for GCS
+
+
+@dataclass
+class CopyResult:
+    source: str
+    destination: str
+    direction: str
+    size: int
+    crc32c: str
+    elapsed: float
+
+    @property
+    def throughput(self) -> float:
+        """Bytes per second copied."""
+        return self.size / self.elapsed if self.elapsed else 0.0
+
+
+@dataclass
+class TransferReport:
+    copied: list = field(default_factory=list)  # CopyResult per object
+    errors: list = field(default_factory=list)  # (source, error message)
+    elapsed: float = 0.0
+
+    @property
+    def bytes_copied(self) -> int:
+        return sum(result.size for result in self.copied)
+
+
+class CrossCloudTransfer:
+    """Streams objects between the S3 bucket of an ``AWS`` and the GCS bucket of a ``GCP``.
+
+    Bytes go from the source download straight into a chunked upload on the other side,
+    so nothing touches the local disk. Each copy holds about two ``buffer_size`` buffers,
+    which bounds memory to roughly ``2 * buffer_size * max_workers``. Every copy is checked
+    with a CRC32C computed while streaming.
+    """
+
+    def __init__(self, aws: AWS, gcp: GCP, buffer_size: int = DEFAULT_BUFFER_SIZE, max_workers: int = 4):
+        if buffer_size % (256 * 1024):
+            raise ValueError("buffer_size must be a multiple of 256 KiB")
+        self.aws = aws
+        self.gcp = gcp
+        self.buffer_size = max(buffer_size, MIN_PART_SIZE)
+        self.max_workers = max_workers
+
+    def s3_to_gcs(self, key: str, blob_name: Optional[str] = None) -> CopyResult:
+        """Copies an S3 object into GCS through a resumable upload."""
+        blob_name = blob_name or key
+        start = time.monotonic()
+        obj = self.aws.s3_client.get_object(Bucket=self.aws.bucket_name, Key=key)
+        checksum = google_crc32c.Checksum()
+        md5 = hashlib.md5()
+        size = 0
+
+        blob = self.gcp.bucket.blob(blob_name)
+        with blob.open("wb", chunk_size=self.buffer_size, content_type=obj.get("ContentType")) as writer:
+            for chunk in obj["Body"].iter_chunks(chunk_size=self.buffer_size):
+                checksum.update(chunk)
+                md5.update(chunk)
+                writer.write(chunk)
+                size += len(chunk)
+
+        crc32c = base64.b64encode(checksum.digest()).decode("utf-8")
+        etag = obj["ETag"].strip('"')
+        blob.reload()
+        if blob.crc32c != crc32c or ("-" not in etag and etag != md5.hexdigest()):
+            blob.delete()
+            raise ValueError(f"Checksum mismatch copying s3://{self.aws.bucket_name}/{key} to {blob_name}")
+
+        return CopyResult(key, blob_name, "s3->gcs", size, crc32c, time.monotonic() - start)
+
+    def gcs_to_s3(self, blob_name: str, key: Optional[str] = None) -> CopyResult:
+        """Copies a GCS blob into S3 through a multipart upload."""
+        key = key or blob_name
+        start = time.monotonic()
+        blob = self.gcp.bucket.get_blob(blob_name)
+        if blob is None:
+            raise FileNotFoundError(f"Blob '{blob_name}' does not exist.")
+        part_size = max(self.buffer_size, -(-(blob.size or 0) // MAX_PARTS))
+        checksum = google_crc32c.Checksum()
+
+        s3 = self.aws.s3_client
+        upload = s3.create_multipart_upload(
+            Bucket=self.aws.bucket_name, Key=key, ContentType=blob.content_type or "application/octet-stream"
+        )
+        try:
+            parts = []
+            with blob.open("rb", chunk_size=part_size) as reader:
+                while True:
+                    data = reader.read(part_size)
+                    if not data and parts:
+                        break
+                    checksum.update(data)
+                    response = s3.upload_part(
+                        Bucket=self.aws.bucket_name,
+                        Key=key,
+                        UploadId=upload["UploadId"],
+                        PartNumber=len(parts) + 1,
+                        Body=data,
+                    )
+                    if response["ETag"].strip('"') != hashlib.md5(data).hexdigest():
+                        raise ValueError(f"S3 stored part {len(parts) + 1} of '{key}' with a different checksum")
+                    parts.append({"PartNumber": len(parts) + 1, "ETag": response["ETag"]})
+                    if len(data) < part_size:
+                        break
+
+            crc32c = base64.b64encode(checksum.digest()).decode("utf-8")
+            if blob.crc32c and blob.crc32c != crc32c:
+                raise ValueError(f"Checksum mismatch reading gs://{self.gcp.bucket.name}/{blob_name}")
+            s3.complete_multipart_upload(
+                Bucket=self.aws.bucket_name,
+                Key=key,
+                UploadId=upload["UploadId"],
+                MultipartUpload={"Parts": parts},
+            )
+        except Exception:
+            s3.abort_multipart_upload(Bucket=self.aws.bucket_name, Key=key, UploadId=upload["UploadId"])
+            raise
+
+        return CopyResult(blob_name, key, "gcs->s3", blob.size or 0, crc32c, time.monotonic() - start)
+
+    def copy_many(self, pairs, direction: str) -> TransferReport:
+        """Copies ``(source, destination)`` pairs concurrently; ``direction`` is "s3->gcs" or "gcs->s3"."""
+        copy = {"s3->gcs": self.s3_to_gcs, "gcs->s3": self.gcs_to_s3}.get(direction)
+        if copy is None:
+            raise ValueError(f"Unknown direction: {direction}")
+        start = time.monotonic()
+        report = TransferReport()
+        with ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as executor:
+            futures = {executor.submit(copy, source, destination): source for source, destination in pairs}
+            for future in as_completed(futures):
+                try:
+                    report.copied.append(future.result())
+                except Exception as e:
+                    report.errors.append((futures[future], str(e)))
+        report.elapsed = time.monotonic() - start
+        return report
+
+
+if __name__ == "__main__":
+    transfer = CrossCloudTransfer(AWS(), GCP())
+    # print(transfer.s3_to_gcs("java-video.mp4", "courses/java-video.mp4"))
+    # print(transfer.gcs_to_s3("courses/java-video.mp4", "java-video.mp4"))
+    report = transfer.copy_many([("java-video.mp4", "courses/java-video.mp4")], "s3->gcs")
+    print(f"Copied {len(report.copied)} objects ({report.bytes_copied} bytes) in {report.elapsed:.1f}s, {len(report.errors)} errors")
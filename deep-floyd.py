@@ -1,42 +1,315 @@
+import gc
+import os
+import json
+import hashlib
+import argparse
+from dataclasses import dataclass
+
+import torch
 from diffusers import DiffusionPipeline
 from diffusers.utils import pt_to_pil
-import torch
 
-# stage 1
-stage_1 = DiffusionPipeline.from_pretrained("DeepFloyd/IF-I-XL-v1.0", variant="fp16", torch_dtype=torch.float16)
-stage_1.enable_xformers_memory_efficient_attention()  # remove line if torch.__version__ >= 2.0.0
-stage_1.enable_model_cpu_offload()
+STAGE_1_MODEL = "DeepFloyd/IF-I-XL-v1.0"
+STAGE_2_MODEL = "DeepFloyd/IF-II-L-v1.0"
+STAGE_3_MODEL = "stabilityai/stable-diffusion-x4-upscaler"
+DEFAULT_PROMPT = 'a photo of a kangaroo wearing an orange hoodie and blue sunglasses standing in front of the eiffel tower holding a sign that says "very deep learning"'
+
+# Rough activation memory per image in fp16, on top of the model weights; used to size batches
+IMAGE_COST_GB = {"encode": 0.05, "stage_1": 0.5, "stage_2": 1.5, "stage_3": 4.0}
+GB = 1024 ** 3
+
+
+@dataclass(frozen=True)
+class StageSettings:
+    stage_1_steps: int = 100
+    stage_1_guidance: float = 7.0
+    stage_2_steps: int = 50
+    stage_2_guidance: float = 4.0
+    stage_3_steps: int = 75
+    stage_3_guidance: float = 9.0
+    noise_level: int = 100
+
+
+@dataclass(frozen=True)
+class PromptJob:
+    """One prompt and seed; the keys name its cached output at every stage.
+
+    Each key covers only the settings that stage and the earlier ones depend on, so a
+    run with, say, different upscaler settings still reuses the stage 1 and 2 tensors.
+    """
+    prompt: str
+    seed: int
+    keys: tuple  # (embeds, stage_1, stage_2, stage_3)
+
+    @classmethod
+    def create(cls, prompt, seed, models, settings):
+        s = settings
+        parts = [
+            (models[0], prompt),
+            (seed, s.stage_1_steps, s.stage_1_guidance),
+            (models[1], s.stage_2_steps, s.stage_2_guidance),
+            (models[2], s.stage_3_steps, s.stage_3_guidance, s.noise_level),
+        ]
+        keys = tuple(
+            hashlib.sha256(json.dumps(parts[:i + 1]).encode("utf-8")).hexdigest()[:20] for i in range(len(parts))
+        )
+        return cls(prompt, seed, keys)
+
+
+def _module_bytes(module):
+    return sum(tensor.numel() * tensor.element_size() for tensor in (*module.parameters(), *module.buffers()))
+
+
+def _modules(pipeline):
+    return [component for component in pipeline.components.values() if isinstance(component, torch.nn.Module)]
+
+
+def _save(value, path):
+    temp_path = f"{path}.tmp"
+    torch.save(value, temp_path)
+    os.replace(temp_path, path)  # a crash never leaves a half-written tensor behind
+
+
+class DeepFloydRunner:
+    """Runs DeepFloyd IF over many prompts one stage at a time.
+
+    The T5 text encoder, stage 1, stage 2 and the x4 upscaler are each loaded once per
+    run, used for every prompt that still needs them, and freed before the next one is
+    loaded. Prompt embeddings and the stage 1 and 2 output tensors are saved under
+    ``cache_dir``, so an interrupted or changed run picks up at the last finished stage.
+    Batch sizes (and, on CUDA, CPU offload) are chosen to fit ``memory_budget_gb``.
+    """
+
+    def __init__(
+        self,
+        stage_1_model=STAGE_1_MODEL,
+        stage_2_model=STAGE_2_MODEL,
+        stage_3_model=STAGE_3_MODEL,
+        cache_dir="if_cache",
+        output_dir=".",
+        device="cuda" if torch.cuda.is_available() else "cpu",
+        dtype=torch.float16,
+        variant="fp16",
+        memory_budget_gb=None,
+        max_batch=8,
+        settings=StageSettings(),
+    ):
+        self.models = (stage_1_model, stage_2_model, stage_3_model)
+        self.cache_dir = cache_dir
+        self.output_dir = output_dir
+        self.device = torch.device(device)
+        self.dtype = dtype
+        self.variant = variant or None
+        self.memory_budget = memory_budget_gb * GB if memory_budget_gb else None
+        self.max_batch = max_batch
+        self.settings = settings
+        for name in ("embeds", "stage_1", "stage_2"):
+            os.makedirs(os.path.join(cache_dir, name), exist_ok=True)
+        os.makedirs(output_dir, exist_ok=True)
+
+    def run(self, prompts, seed=0):
+        """Renders every prompt through all three stages and returns the final image paths."""
+        jobs = [PromptJob.create(prompt, seed, self.models, self.settings) for prompt in prompts]
+        # Work backwards from the final images: a stage runs only for the jobs whose later
+        # stages still need its output, so finished jobs never load or run anything.
+        stage_3 = self._missing(jobs, self._final_path)
+        stage_2 = self._missing(stage_3, lambda job: self._path("stage_2", job.keys[2]))
+        stage_1 = self._missing(stage_2, lambda job: self._path("stage_1", job.keys[1]))
+        encode = self._missing(stage_2, lambda job: self._path("embeds", job.keys[0]))  # stages 1 and 2 read them
+        if not stage_3:
+            print(f"all {len(jobs)} images exist, nothing to run")
+        self._stage("encode", encode, self._load_encoder, self._encode)
+        self._stage("stage_1", stage_1, self._load_stage_1, self._run_stage_1)
+        self._stage("stage_2", stage_2, self._load_stage_2, self._run_stage_2)
+        self._stage("stage_3", stage_3, self._load_stage_3, self._run_stage_3)
+        return [self._final_path(job) for job in jobs]
+
+    def _path(self, stage, key):
+        return os.path.join(self.cache_dir, stage, f"{key}.pt")
+
+    def _final_path(self, job):
+        return os.path.join(self.output_dir, f"if_stage_III_{job.keys[3]}.png")
+
+    @staticmethod
+    def _missing(jobs, output_path):
+        """The jobs whose ``output_path`` does not exist yet, one per distinct path."""
+        return list({output_path(job): job for job in jobs if not os.path.exists(output_path(job))}.values())
+
+    def _stage(self, name, pending, load, run):
+        if not pending:
+            return
+        pipeline = load()
+        try:
+            batch_size = self._place(name, pipeline)
+            print(f"{name}: {len(pending)} to run in batches of {batch_size}")
+            for start in range(0, len(pending), batch_size):
+                with torch.inference_mode():
+                    run(pipeline, pending[start:start + batch_size])
+        finally:
+            del pipeline
+            gc.collect()
+            if self.device.type == "cuda":
+                torch.cuda.empty_cache()
+
+    def _place(self, name, pipeline):
+        """Moves the pipeline to the device (offloading if it does not fit) and returns a batch size."""
+        weights = sum(_module_bytes(module) for module in _modules(pipeline))
+        per_image = IMAGE_COST_GB[name] * GB * torch.finfo(self.dtype).bits / 16
+        resident = weights
+        if self.device.type == "cuda" and self.memory_budget and weights + per_image > self.memory_budget:
+            # Keep only the module that is running on the GPU
+            pipeline.enable_model_cpu_offload()
+            resident = max((_module_bytes(module) for module in _modules(pipeline)), default=0)
+        else:
+            pipeline.to(self.device)
+        pipeline.set_progress_bar_config(disable=True)
+        if not self.memory_budget:
+            return self.max_batch
+        return max(1, min(self.max_batch, int((self.memory_budget - resident) // per_image)))
+
+    def _generators(self, jobs):
+        return [torch.Generator().manual_seed(job.seed) for job in jobs]
+
+    def _load_pipeline(self, model, **components):
+        return DiffusionPipeline.from_pretrained(model, variant=self.variant, torch_dtype=self.dtype, **components)
+
+    # --- text encoder ---
+
+    def _load_encoder(self):
+        return self._load_pipeline(
+            self.models[0], unet=None, safety_checker=None, feature_extractor=None, watermarker=None,
+            requires_safety_checker=False,
+        )
+
+    def _encode(self, pipeline, jobs):
+        prompt_embeds, negative_embeds = pipeline.encode_prompt([job.prompt for job in jobs], device=self.device)
+        for i, job in enumerate(jobs):
+            _save((prompt_embeds[i:i + 1].cpu(), negative_embeds[i:i + 1].cpu()), self._path("embeds", job.keys[0]))
+
+    def _embeds(self, jobs):
+        pairs = [torch.load(self._path("embeds", job.keys[0])) for job in jobs]
+        return (
+            torch.cat([positive for positive, _ in pairs]).to(self.device, self.dtype),
+            torch.cat([negative for _, negative in pairs]).to(self.device, self.dtype),
+        )
+
+    # --- stage 1: 64x64 ---
+
+    def _load_stage_1(self):
+        return self._load_pipeline(
+            self.models[0], text_encoder=None, safety_checker=None, feature_extractor=None, watermarker=None,
+            requires_safety_checker=False,
+        )
+
+    def _run_stage_1(self, pipeline, jobs):
+        prompt_embeds, negative_embeds = self._embeds(jobs)
+        images = pipeline(
+            prompt_embeds=prompt_embeds,
+            negative_prompt_embeds=negative_embeds,
+            num_inference_steps=self.settings.stage_1_steps,
+            guidance_scale=self.settings.stage_1_guidance,
+            generator=self._generators(jobs),
+            output_type="pt",
+        ).images
+        for i, job in enumerate(jobs):
+            _save(images[i:i + 1].cpu(), self._path("stage_1", job.keys[1]))
+            pt_to_pil(images[i:i + 1])[0].save(os.path.join(self.output_dir, f"if_stage_I_{job.keys[1]}.png"))
+
+    # --- stage 2: 256x256 ---
+
+    def _load_stage_2(self):
+        return self._load_pipeline(
+            self.models[1], text_encoder=None, safety_checker=None, feature_extractor=None, watermarker=None,
+            requires_safety_checker=False,
+        )
+
+    def _run_stage_2(self, pipeline, jobs):
+        prompt_embeds, negative_embeds = self._embeds(jobs)
+        images = pipeline(
+            image=torch.cat([torch.load(self._path("stage_1", job.keys[1])) for job in jobs]).to(self.device, self.dtype),
+            prompt_embeds=prompt_embeds,
+            negative_prompt_embeds=negative_embeds,
+            num_inference_steps=self.settings.stage_2_steps,
+            guidance_scale=self.settings.stage_2_guidance,
+            generator=self._generators(jobs),
+            output_type="pt",
+        ).images
+        for i, job in enumerate(jobs):
+            _save(images[i:i + 1].cpu(), self._path("stage_2", job.keys[2]))
+            pt_to_pil(images[i:i + 1])[0].save(os.path.join(self.output_dir, f"if_stage_II_{job.keys[2]}.png"))
 
-# stage 2
-stage_2 = DiffusionPipeline.from_pretrained(
-    "DeepFloyd/IF-II-L-v1.0", text_encoder=None, variant="fp16", torch_dtype=torch.float16
-)
-stage_2.enable_xformers_memory_efficient_attention()  # remove line if torch.__version__ >= 2.0.0
-stage_2.enable_model_cpu_offload()
+    # --- stage 3: x4 upscale to 1024x1024 ---
 
-# stage 3
-safety_modules = {"feature_extractor": stage_1.feature_extractor, "safety_checker": stage_1.safety_checker, "watermarker": stage_1.watermarker}
-stage_3 = DiffusionPipeline.from_pretrained("stabilityai/stable-diffusion-x4-upscaler", **safety_modules, torch_dtype=torch.float16)
-stage_3.enable_xformers_memory_efficient_attention()  # remove line if torch.__version__ >= 2.0.0
-stage_3.enable_model_cpu_offload()
+    def _load_stage_3(self):
+        # The safety checker and watermarker come from stage 1, without its T5 encoder or UNet
+        safety = self._load_pipeline(self.models[0], text_encoder=None, unet=None)
+        safety_modules = {name: getattr(safety, name) for name in ("feature_extractor", "safety_checker", "watermarker")}
+        del safety
+        return DiffusionPipeline.from_pretrained(self.models[2], torch_dtype=self.dtype, **safety_modules)
 
-prompt = 'a photo of a kangaroo wearing an orange hoodie and blue sunglasses standing in front of the eiffel tower holding a sign that says "very deep learning"'
+    def _run_stage_3(self, pipeline, jobs):
+        images = pipeline(
+            prompt=[job.prompt for job in jobs],
+            image=torch.cat([torch.load(self._path("stage_2", job.keys[2])) for job in jobs]).to(self.device, self.dtype),
+            num_inference_steps=self.settings.stage_3_steps,
+            guidance_scale=self.settings.stage_3_guidance,
+            noise_level=self.settings.noise_level,
+            generator=self._generators(jobs),
+        ).images
+        for image, job in zip(images, jobs):
+            temp_path = f"{self._final_path(job)}.tmp"
+            image.save(temp_path, format="PNG")
+            os.replace(temp_path, self._final_path(job))
 
-# text embeds
-prompt_embeds, negative_embeds = stage_1.encode_prompt(prompt)
 
-generator = torch.manual_seed(0)
+def main():
+    parser = argparse.ArgumentParser(description="Batched, resumable DeepFloyd IF text-to-image runner")
+    parser.add_argument("prompts", nargs="*", help="prompts to render (default: the kangaroo prompt)")
+    parser.add_argument("--prompts-file", help="one prompt per line")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stage-1", default=STAGE_1_MODEL)
+    parser.add_argument("--stage-2", default=STAGE_2_MODEL)
+    parser.add_argument("--stage-3", default=STAGE_3_MODEL)
+    parser.add_argument("--variant", default="fp16", help="checkpoint variant of stages 1 and 2; '' for none")
+    parser.add_argument("--dtype", choices=["float16", "bfloat16", "float32"], default="float16")
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--memory-budget-gb", type=float, help="device memory to plan batches and offload against")
+    parser.add_argument("--max-batch", type=int, default=8)
+    parser.add_argument("--cache-dir", default="if_cache")
+    parser.add_argument("--output-dir", default=".")
+    parser.add_argument("--stage-1-steps", type=int, default=StageSettings.stage_1_steps)
+    parser.add_argument("--stage-2-steps", type=int, default=StageSettings.stage_2_steps)
+    parser.add_argument("--stage-3-steps", type=int, default=StageSettings.stage_3_steps)
+    parser.add_argument("--noise-level", type=int, default=StageSettings.noise_level)
+    args = parser.parse_args()
 
-# stage 1
-image = stage_1(prompt_embeds=prompt_embeds, negative_prompt_embeds=negative_embeds, generator=generator, output_type="pt").images
-pt_to_pil(image)[0].save("./if_stage_I.png")
+    prompts = list(args.prompts)
+    if args.prompts_file:
+        with open(args.prompts_file) as fp:
+            prompts += [line.strip() for line in fp if line.strip()]
+    runner = DeepFloydRunner(
+        args.stage_1,
+        args.stage_2,
+        args.stage_3,
+        cache_dir=args.cache_dir,
+        output_dir=args.output_dir,
+        device=args.device,
+        dtype=getattr(torch, args.dtype),
+        variant=args.variant,
+        memory_budget_gb=args.memory_budget_gb,
+        max_batch=args.max_batch,
+        settings=StageSettings(
+            stage_1_steps=args.stage_1_steps,
+            stage_2_steps=args.stage_2_steps,
+            stage_3_steps=args.stage_3_steps,
+            noise_level=args.noise_level,
+        ),
+    )
+    for path in runner.run(prompts or [DEFAULT_PROMPT], seed=args.seed):
+        print(f"Image saved as {path}")
 
-# stage 2
-image = stage_2(
-    image=image, prompt_embeds=prompt_embeds, negative_prompt_embeds=negative_embeds, generator=generator, output_type="pt"
-).images
-pt_to_pil(image)[0].save("./if_stage_II.png")
 
-# stage 3
-image = stage_3(prompt=prompt, image=image, generator=generator, noise_level=100).images
-image[0].save("./if_stage_III.png")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
+    # python deep-floyd.py "a red fox in the snow" "a lighthouse at dusk" --memory-budget-gb 16
+    # python deep-floyd.py --prompts-file prompts.txt --stage-3-steps 50  # reuses cached stage 1 and 2 outputs
@@ -1,26 +1,422 @@
-from diffusers import DiffusionPipeline
+import os
+import sys
+import json
+import queue
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
 import torch
+from diffusers import DiffusionPipeline
+
+PRIOR_MODEL = "kandinsky-community/kandinsky-2-2-prior"  # text-to-image embeddings
+DECODER_MODEL = "kandinsky-community/kandinsky-2-2-decoder"  # embeddings to image
+DEFAULT_PROMPT = "A scenic mountain view with a river flowing through it"
+DEFAULT_NEGATIVE_PROMPT = "blurry, low quality, bad lighting"
+
+
+@dataclass(frozen=True)
+class GenerationRequest:
+    prompt: str
+    negative_prompt: Optional[str] = None
+    seed: int = 0  # fixes the prior, so it is part of the embedding cache key
+    variation: int = 0  # decoder noise only: new images from the same (cached) embeddings
+
+    @property
+    def decoder_seed(self) -> int:
+        return (self.seed * 1_000_003 + self.variation) % 2**63
+
+
+class EmbeddingCache:
+    """LRU of prior outputs keyed by ``KandinskyService.embed_key``.
+
+    With a ``directory`` the embeddings are also saved as .pt files, so they survive
+    restarts of the service.
+    """
+
+    def __init__(self, max_entries=256, directory=None):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        digest = hashlib.sha256(json.dumps(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest + ".pt")
+
+    def get(self, key):
+        """Returns ``(image_embeds, negative_image_embeds)`` on the CPU, or None."""
+        with self._lock:
+            embeds = self._entries.get(key)
+            if embeds is not None:
+                self._entries.move_to_end(key)
+        if embeds is None and self.directory and os.path.exists(self._path(key)):
+            embeds = tuple(torch.load(self._path(key), map_location="cpu"))
+            self._remember(key, embeds)
+        with self._lock:
+            if embeds is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return embeds
+
+    def put(self, key, embeds):
+        embeds = tuple(tensor.detach().to("cpu") for tensor in embeds)
+        self._remember(key, embeds)
+        if self.directory:
+            temp_path = f"{self._path(key)}.{threading.get_ident()}.tmp"
+            torch.save(embeds, temp_path)
+            os.replace(temp_path, self._path(key))
+        return embeds
+
+    def _remember(self, key, embeds):
+        with self._lock:
+            self._entries[key] = embeds
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class KandinskyService:
+    """Long-lived Kandinsky 2.2 generator: both pipelines are loaded once and stay loaded.
+
+    Requests queue up and are rendered in batches of up to ``max_batch``. Prior outputs
+    come from the EmbeddingCache when possible, so re-renders and variations only run
+    the decoder, and finished images are written by a background thread pool while the
+    next batch is already rendering. Every request gets its own seeded generator, so an
+    image does not depend on which batch it landed in (beyond floating-point rounding).
+    """
+
+    def __init__(
+        self,
+        prior_path=PRIOR_MODEL,
+        decoder_path=DECODER_MODEL,
+        device="cpu",
+        dtype=torch.float32,
+        output_dir=".",
+        max_batch=4,
+        max_wait_s=0.05,
+        height=512,
+        width=512,
+        prior_steps=25,
+        decoder_steps=50,
+        guidance_scale=4.0,
+        embed_cache=None,
+        writers=2,
+    ):
+        self.prior_path = prior_path
+        self.decoder_path = decoder_path
+        self.device = device
+        self.dtype = dtype
+        self.output_dir = output_dir
+        self.max_batch = max_batch
+        self.max_wait_s = max_wait_s
+        self.height = height
+        self.width = width
+        self.prior_steps = prior_steps
+        self.decoder_steps = decoder_steps
+        self.guidance_scale = guidance_scale
+        self.embed_cache = embed_cache or EmbeddingCache()
+        self.prior_runs = 0
+        self.decoder_runs = 0
+        os.makedirs(output_dir, exist_ok=True)
+
+        self.prior = DiffusionPipeline.from_pretrained(prior_path, torch_dtype=dtype).to(device)
+        self.decoder = DiffusionPipeline.from_pretrained(decoder_path, torch_dtype=dtype).to(device)
+        for pipeline in (self.prior, self.decoder):
+            pipeline.set_progress_bar_config(disable=True)
+
+        self._queue = queue.Queue()
+        self._writer = ThreadPoolExecutor(max_workers=writers, thread_name_prefix="image-writer")
+        self._worker = threading.Thread(target=self._run, name="kandinsky", daemon=True)
+        self._worker.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def submit(self, request: GenerationRequest) -> Future:
+        """Queues a request; the Future resolves to the image path once it is on disk."""
+        future = Future()
+        self._queue.put((request, future))
+        return future
+
+    def generate(self, requests):
+        """Renders ``requests`` and returns their image paths in the same order."""
+        futures = [self.submit(request) for request in requests]
+        return [future.result() for future in futures]
+
+    def close(self):
+        """Finishes queued requests and pending writes, then stops the worker."""
+        self._queue.put(None)
+        self._worker.join()
+        self._writer.shutdown(wait=True)
+
+    def embed_key(self, request: GenerationRequest) -> tuple:
+        """Everything the prior output depends on, so a persisted cache never serves stale embeddings."""
+        return (
+            self.prior_path, self.prior_steps, str(self.dtype), request.prompt, request.negative_prompt, request.seed
+        )
+
+    def output_path(self, request: GenerationRequest) -> str:
+        settings = [
+            *self.embed_key(request), self.decoder_path, request.variation,
+            self.height, self.width, self.decoder_steps, self.guidance_scale,
+        ]
+        digest = hashlib.sha256(json.dumps(settings).encode("utf-8")).hexdigest()[:20]
+        return os.path.join(self.output_dir, f"kandinsky_{digest}.png")
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            stop = False
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=self.max_wait_s)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            try:
+                self._render(batch)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            if stop:
+                return
+
+    @torch.inference_mode()
+    def _render(self, batch):
+        requests = [request for request, _ in batch]
+        embeds = self._embeddings(requests)
+        keys = [self.embed_key(request) for request in requests]
+        image_embeds = torch.cat([embeds[key][0] for key in keys]).to(self.device)
+        negative_image_embeds = torch.cat([embeds[key][1] for key in keys]).to(self.device)
+        images = self.decoder(
+            image_embeds=image_embeds,
+            negative_image_embeds=negative_image_embeds,
+            height=self.height,
+            width=self.width,
+            num_inference_steps=self.decoder_steps,
+            guidance_scale=self.guidance_scale,
+            generator=[torch.Generator().manual_seed(request.decoder_seed) for request in requests],
+        ).images
+        self.decoder_runs += 1
+        for (request, future), image in zip(batch, images):
+            self._writer.submit(self._write, image, self.output_path(request), future)
+
+    def _embeddings(self, requests):
+        """Returns ``{embed_key: (image_embeds, negative_image_embeds)}``, running the prior only for misses."""
+        embeds = {}
+        missing = {}
+        for request in requests:
+            key = self.embed_key(request)
+            if key in embeds or key in missing:
+                continue
+            cached = self.embed_cache.get(key)
+            if cached is None:
+                missing[key] = request
+            else:
+                embeds[key] = cached
+
+        # The prior batches negative prompts by appending them to the prompts, so requests
+        # with and without one are run separately
+        for with_negative in (True, False):
+            group = [request for request in missing.values() if (request.negative_prompt is not None) == with_negative]
+            if not group:
+                continue
+            generators = [torch.Generator().manual_seed(request.seed) for request in group]
+            if with_negative:
+                generators += [torch.Generator().manual_seed(request.seed) for request in group]
+            output = self.prior(
+                prompt=[request.prompt for request in group],
+                negative_prompt=[request.negative_prompt for request in group] if with_negative else None,
+                num_inference_steps=self.prior_steps,
+                generator=generators,
+            )
+            self.prior_runs += 1
+            for i, request in enumerate(group):
+                key = self.embed_key(request)
+                result = (output.image_embeds[i:i + 1], output.negative_image_embeds[i:i + 1])
+                embeds[key] = self.embed_cache.put(key, result)
+        return embeds
+
+    @staticmethod
+    def _write(image, path, future):
+        # Identical requests in one batch share ``path``; each writer needs its own temp file
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            image.save(temp_path, format="PNG")
+            os.replace(temp_path, path)
+            future.set_result(path)
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+def save_tiny_checkpoints(directory):
+    """Writes random-weight prior and decoder checkpoints a few MB in size, for CPU smoke tests.
+
+    Returns ``(prior_path, decoder_path)``. Images made with them are noise.
+    """
+    from diffusers import (
+        DDIMScheduler, KandinskyV22Pipeline, KandinskyV22PriorPipeline, PriorTransformer, UNet2DConditionModel,
+        UnCLIPScheduler, VQModel,
+    )
+    from transformers import (
+        CLIPImageProcessor, CLIPTextConfig, CLIPTextModelWithProjection, CLIPTokenizer, CLIPVisionConfig,
+        CLIPVisionModelWithProjection,
+    )
+
+    torch.manual_seed(0)
+    prior_path = os.path.join(directory, "prior")
+    decoder_path = os.path.join(directory, "decoder")
+    tokenizer_path = os.path.join(directory, "tokenizer")
+    os.makedirs(tokenizer_path, exist_ok=True)
+
+    # Byte-level BPE vocabulary without merges: every character is its own token
+    printable = [*range(ord("!"), ord("~") + 1), *range(ord("¡"), ord("¬") + 1), *range(ord("®"), ord("ÿ") + 1)]
+    characters = [chr(b) for b in printable] + [chr(256 + n) for n in range(256 - len(printable))]
+    vocab = {"<|startoftext|>": 0, "!": 1, "<|endoftext|>": 2}
+    for token in characters + [c + "</w>" for c in characters]:
+        vocab.setdefault(token, len(vocab))
+    with open(os.path.join(tokenizer_path, "vocab.json"), "w") as fp:
+        json.dump(vocab, fp)
+    with open(os.path.join(tokenizer_path, "merges.txt"), "w") as fp:
+        fp.write("#version: 0.2\n")
+    tokenizer = CLIPTokenizer(
+        os.path.join(tokenizer_path, "vocab.json"), os.path.join(tokenizer_path, "merges.txt"), model_max_length=77
+    )
+
+    prior = PriorTransformer(num_attention_heads=2, attention_head_dim=12, embedding_dim=32, num_layers=1)
+    prior.clip_std = torch.nn.Parameter(torch.ones(prior.clip_std.shape))
+    KandinskyV22PriorPipeline(
+        prior=prior,
+        image_encoder=CLIPVisionModelWithProjection(CLIPVisionConfig(
+            hidden_size=32, image_size=32, projection_dim=32, intermediate_size=37, num_attention_heads=4,
+            num_hidden_layers=2, patch_size=8,
+        )),
+        text_encoder=CLIPTextModelWithProjection(CLIPTextConfig(
+            bos_token_id=0, eos_token_id=2, pad_token_id=1, hidden_size=32, projection_dim=32, intermediate_size=37,
+            num_attention_heads=4, num_hidden_layers=2, vocab_size=len(vocab),
+        )),
+        tokenizer=tokenizer,
+        scheduler=UnCLIPScheduler(
+            variance_type="fixed_small_log", prediction_type="sample", clip_sample=True, clip_sample_range=10.0
+        ),
+        image_processor=CLIPImageProcessor(crop_size=32, size=32),
+    ).save_pretrained(prior_path)
+
+    KandinskyV22Pipeline(
+        unet=UNet2DConditionModel(
+            in_channels=4,
+            out_channels=8,
+            addition_embed_type="image",
+            down_block_types=("ResnetDownsampleBlock2D", "SimpleCrossAttnDownBlock2D"),
+            up_block_types=("SimpleCrossAttnUpBlock2D", "ResnetUpsampleBlock2D"),
+            mid_block_type="UNetMidBlock2DSimpleCrossAttn",
+            block_out_channels=(32, 64),
+            layers_per_block=1,
+            encoder_hid_dim=32,
+            encoder_hid_dim_type="image_proj",
+            cross_attention_dim=32,
+            attention_head_dim=4,
+            resnet_time_scale_shift="scale_shift",
+        ),
+        scheduler=DDIMScheduler(
+            beta_schedule="linear", beta_start=0.00085, beta_end=0.012, clip_sample=False, set_alpha_to_one=False,
+            steps_offset=1,
+        ),
+        movq=VQModel(
+            block_out_channels=[32, 64],
+            down_block_types=["DownEncoderBlock2D", "AttnDownEncoderBlock2D"],
+            up_block_types=["AttnUpDecoderBlock2D", "UpDecoderBlock2D"],
+            latent_channels=4,
+            layers_per_block=1,
+            norm_num_groups=8,
+            norm_type="spatial",
+            num_vq_embeddings=12,
+            vq_embed_dim=4,
+        ),
+    ).save_pretrained(decoder_path)
+    return prior_path, decoder_path
+
 
-# Load Kandinsky prior (text-to-image embeddings)
-prior = DiffusionPipeline.from_pretrained("kandinsky-community/kandinsky-2-2-prior", torch_dtype=torch.float32)
-prior.to("cpu")  # Use CPU (change to "cuda" if you have a GPU)
+def main():
+    parser = argparse.ArgumentParser(description="Batched Kandinsky 2.2 text-to-image generation")
+    parser.add_argument("prompts", nargs="*", help=f"prompts to render (default: {DEFAULT_PROMPT!r})")
+    parser.add_argument("--negative-prompt", default=DEFAULT_NEGATIVE_PROMPT, help="'' for none")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--variations", type=int, default=1, help="images per prompt from the same embeddings")
+    parser.add_argument("--stdin", action="store_true", help="keep running and render one prompt per input line")
+    parser.add_argument("--prior", default=PRIOR_MODEL, help="prior model id or local path")
+    parser.add_argument("--decoder", default=DECODER_MODEL, help="decoder model id or local path")
+    parser.add_argument("--make-tiny", metavar="DIR", help="write tiny random-weight checkpoints to DIR and use them")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--dtype", choices=["float32", "float16", "bfloat16"], default="float32")
+    parser.add_argument("--output-dir", default=".")
+    parser.add_argument("--embed-cache-dir", help="persist prior embeddings here")
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--height", type=int, default=512)
+    parser.add_argument("--width", type=int, default=512)
+    parser.add_argument("--prior-steps", type=int, default=25)
+    parser.add_argument("--decoder-steps", type=int, default=50)
+    args = parser.parse_args()
 
-# Generate image embeddings from text prompt
-prompt = "A scenic mountain view with a river flowing through it"
-negative_prompt = "blurry, low quality, bad lighting"  # Optional: Negative prompt for guidance
-generator = torch.manual_seed(0)  # Fix randomness for reproducibility
+    if args.make_tiny:
+        args.prior, args.decoder = save_tiny_checkpoints(args.make_tiny)
+    negative_prompt = args.negative_prompt or None
 
-# 🔹 Get both image and negative embeddings
-prior_output = prior(prompt=prompt, negative_prompt=negative_prompt, generator=generator)
-image_embeds = prior_output.image_embeds
-negative_image_embeds = prior_output.negative_image_embeds  # FIXED!
+    def requests_for(prompt):
+        return [GenerationRequest(prompt, negative_prompt, args.seed, variation) for variation in range(args.variations)]
 
-# Load Kandinsky decoder (convert embeddings to image)
-decoder = DiffusionPipeline.from_pretrained("kandinsky-community/kandinsky-2-2-decoder", torch_dtype=torch.float32)
-decoder.to("cpu")  # Use CPU (change to "cuda" if you have a GPU)
+    service = KandinskyService(
+        args.prior,
+        args.decoder,
+        device=args.device,
+        dtype=getattr(torch, args.dtype),
+        output_dir=args.output_dir,
+        max_batch=args.batch_size,
+        height=args.height,
+        width=args.width,
+        prior_steps=args.prior_steps,
+        decoder_steps=args.decoder_steps,
+        embed_cache=EmbeddingCache(directory=args.embed_cache_dir),
+    )
+    with service:
+        if args.stdin:
+            for line in sys.stdin:
+                if line.strip():
+                    for request in requests_for(line.strip()):
+                        service.submit(request).add_done_callback(
+                            lambda future: print(f"Image saved as {future.result()}" if not future.exception() else f"Failed: {future.exception()}")
+                        )
+        else:
+            requests = [request for prompt in args.prompts or [DEFAULT_PROMPT] for request in requests_for(prompt)]
+            for path in service.generate(requests):
+                print(f"Image saved as {path}")
+    print(f"Prior runs: {service.prior_runs}, decoder runs: {service.decoder_runs}, embedding cache hits: {service.embed_cache.hits}")
 
-# Generate final image from embeddings
-image = decoder(image_embeds=image_embeds, negative_image_embeds=negative_image_embeds).images[0]
-image.save("kandinsky_output.png")
 
-print("Image saved as kandinsky_output.png")
+if __name__ == "__main__":
+    main()
+    # python diffusion.py "A scenic mountain view with a river flowing through it" --variations 4
+    # python diffusion.py --make-tiny /tmp/kandinsky-tiny --height 64 --width 64 --prior-steps 2 --decoder-steps 2 "a cat" "a dog"
+    # printf 'a cat\na dog\n' | python diffusion.py --stdin --embed-cache-dir ~/.cache/kandinsky-embeds
@@ -1,25 +1,126 @@
 import os
+import time
+import random
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import gspread
-import pandas as pd
+import numpy as np
 from faker import Faker
 from oauth2client.service_account import ServiceAccountCredentials
 from dotenv import load_dotenv
 
+from sheet_sinks import CsvSink, ParquetSink, write_batches
+from rate_limit import RateLimiter
+
 load_dotenv()
 
+COLUMNS = ["name", "email", "phone", "linkedin", "company_name", "designation"]
+SHARD_SIZE = 50000
+BATCH_SIZE = 10000
+POOL_SIZE = 5000
+SHEET_CHUNK_ROWS = 5000
+SHEET_WRITES_PER_MINUTE = 60  # default per-user write quota of the Sheets API
+
+
+def _generate_shard(seed, shard_index, count):
+    """Generates one shard of rows in a worker process; emails and phones are unique within it."""
+    sheet = FakeSheet(seed)
+    sheet.fake.seed_instance(f"{seed}-{shard_index}")
+    sheet.generate_data(count)
+    return sheet.data
+
+
+class ColumnarGenerator:
+    """Builds whole columns at once from value pools that are sampled from Faker only once.
+
+    Emails and phones are unique by construction, without any lookup sets: the email
+    carries the row's serial number, and the phone number is an affine permutation of it
+    (``(a * serial + b) mod M`` with ``a`` coprime to ``M``), so no two rows ever share one.
+    """
+
+    PHONE_SPACE = 8 * 10 ** 9  # 10-digit numbers whose area code starts with 2-9
+
+    def __init__(self, seed=42, pool_size=POOL_SIZE):
+        fake = Faker()
+        fake.seed_instance(f"{seed}-pools")
+        first_names = [fake.first_name() for _ in range(pool_size)]
+        last_names = [fake.last_name() for _ in range(pool_size)]
+        self.first_names = np.array(first_names, dtype=object)
+        self.last_names = np.array(last_names, dtype=object)
+        self.first_slugs = np.array([self._slug(name) for name in first_names], dtype=object)
+        self.last_slugs = np.array([self._slug(name) for name in last_names], dtype=object)
+        self.email_domains = np.array(sorted({fake.free_email_domain() for _ in range(pool_size // 10)}
+                                             | {fake.domain_name() for _ in range(pool_size // 10)}), dtype=object)
+        self.urls = np.array([fake.url() for _ in range(pool_size)], dtype=object)
+        self.companies = np.array([fake.company() for _ in range(pool_size)], dtype=object)
+        self.jobs = np.array([fake.job() for _ in range(pool_size)], dtype=object)
+
+        self.rng = np.random.default_rng(list(f"{seed}".encode()))
+        multiplier = int(self.rng.integers(10 ** 8, 2 ** 31))
+        while multiplier % 2 == 0 or multiplier % 5 == 0:
+            multiplier += 1
+        self._phone_multiplier = multiplier
+        self._phone_offset = int(self.rng.integers(0, self.PHONE_SPACE))
+        self.rows_generated = 0
+
+    @staticmethod
+    def _slug(name):
+        return "".join(ch for ch in name.lower() if ch.isalnum())
+
+    def _sample(self, pool, count):
+        return pool[self.rng.integers(0, len(pool), count)]
+
+    def generate(self, count):
+        """Returns the next ``count`` rows as ``{column: [values]}``."""
+        serials = np.arange(self.rows_generated, self.rows_generated + count, dtype=np.int64)
+        self.rows_generated += count
+
+        first_index = self.rng.integers(0, len(self.first_names), count)
+        last_index = self.rng.integers(0, len(self.last_names), count)
+        names = self.first_names[first_index] + " " + self.last_names[last_index]
+        emails = [
+            f"{first}.{last}{serial}@{domain}"
+            for first, last, serial, domain in zip(
+                self.first_slugs[first_index].tolist(),
+                self.last_slugs[last_index].tolist(),
+                serials.tolist(),
+                self._sample(self.email_domains, count).tolist(),
+            )
+        ]
+        numbers = (serials * self._phone_multiplier + self._phone_offset) % self.PHONE_SPACE + 2 * 10 ** 9
+        phones = [
+            f"+1-{area:03d}-{exchange:03d}-{line:04d}"
+            for area, exchange, line in zip(
+                (numbers // 10 ** 7).tolist(), (numbers // 10 ** 4 % 1000).tolist(), (numbers % 10 ** 4).tolist()
+            )
+        ]
+        return {
+            "name": names.tolist(),
+            "email": emails,
+            "phone": phones,
+            "linkedin": self._sample(self.urls, count).tolist(),
+            "company_name": self._sample(self.companies, count).tolist(),
+            "designation": self._sample(self.jobs, count).tolist(),
+        }
+
+
 class FakeSheet:
-    def __init__(self):
+    def __init__(self, seed=42):
+        self.seed = seed
         self.fake = Faker()
-        Faker.seed(42)
+        Faker.seed(seed)
         self.emails = set()
         self.phones = set()
+        self.email_retries = 0
+        self.phone_retries = 0
         self.data = []
+        self._columnar = None
         self.google_credentials = os.getenv("GOOGLE_CREDENTIALS")
         self.share_email = os.getenv("SHARE_EMAIL")
 
     def generate_unique_email(self):
         email = self.fake.email()
         while email in self.emails:
+            self.email_retries += 1
             email = self.fake.email()
         self.emails.add(email)
         return email
@@ -27,41 +128,159 @@ class FakeSheet:
     def generate_unique_phone(self):
         phone = self.fake.phone_number()
         while phone in self.phones:
+            self.phone_retries += 1
             phone = self.fake.phone_number()
         self.phones.add(phone)
         return phone
 
-    def generate_data(self, count=20000):
+    def generate_data(self, count=20000, processes=1, shard_size=SHARD_SIZE, engine="faker"):
+        """Appends ``count`` rows to ``self.data``.
+
+        ``engine="pool"`` uses the ColumnarGenerator, which is far faster than per-row Faker
+        calls and needs no process pool; ``processes`` only applies to the Faker engine.
+        """
+        if engine == "pool":
+            for start in range(0, count, BATCH_SIZE):
+                columns = self.columnar.generate(min(BATCH_SIZE, count - start))
+                self.data.extend(map(list, zip(*(columns[column] for column in COLUMNS))))
+            return
+        if processes and processes > 1:
+            return self._generate_data_sharded(count, processes, shard_size)
         for _ in range(count):
-            # Generate fake data
-            # You can add more fields as needed
-            self.data.append([
-                self.fake.name(),
-                self.generate_unique_email(),
-                self.generate_unique_phone(),
-                self.fake.url(),
-                self.fake.company(),
-                self.fake.job()
-            ])
-
-    def upload_to_google_sheet(self):
-        # Convert data to DataFrame 
-        # and upload to Google Sheet
-        df = pd.DataFrame(self.data, columns=["name", "email", "phone", "linkedin", "company_name", "designation"])
-        
+            self.data.append(self.generate_row())
+
+    def generate_row(self):
+        # Generate fake data
+        # You can add more fields as needed
+        return [
+            self.fake.name(),
+            self.generate_unique_email(),
+            self.generate_unique_phone(),
+            self.fake.url(),
+            self.fake.company(),
+            self.fake.job()
+        ]
+
+    @property
+    def columnar(self):
+        if self._columnar is None:
+            self._columnar = ColumnarGenerator(self.seed)
+        return self._columnar
+
+    def iter_batches(self, count, batch_size=BATCH_SIZE, engine="pool"):
+        """Yields ``count`` rows as columnar batches (``{column: [values]}``) without keeping them.
+
+        The default pool engine is unique by construction, so memory stays bounded by
+        ``batch_size`` however large ``count`` is. ``engine="faker"`` still works, but its
+        email/phone uniqueness sets grow with ``count``.
+        """
+        for start in range(0, count, batch_size):
+            size = min(batch_size, count - start)
+            if engine == "pool":
+                yield self.columnar.generate(size)
+            else:
+                rows = [self.generate_row() for _ in range(size)]
+                yield dict(zip(COLUMNS, map(list, zip(*rows))))
+
+    def export_csv(self, path, count, batch_size=BATCH_SIZE, engine="pool"):
+        return write_batches(self.iter_batches(count, batch_size, engine), CsvSink(path, COLUMNS))
+
+    def export_parquet(self, path, count, batch_size=BATCH_SIZE, engine="pool"):
+        return write_batches(self.iter_batches(count, batch_size, engine), ParquetSink(path, COLUMNS))
+
+    def _generate_data_sharded(self, count, processes, shard_size):
+        # Shards are fixed-size and seeded from (seed, shard index), so the output depends
+        # only on the seed and count, never on the number of processes.
+        shard_counts = [min(shard_size, count - start) for start in range(0, count, shard_size)]
+        repair_fake = Faker()
+        repair_fake.seed_instance(f"{self.seed}-repair")
+
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            shards = executor.map(_generate_shard, [self.seed] * len(shard_counts), range(len(shard_counts)), shard_counts)
+            # Merge in shard order; a value already taken by an earlier shard is redrawn
+            # from a separately seeded Faker, which keeps the repair deterministic too.
+            for rows in shards:
+                for row in rows:
+                    while row[1] in self.emails:
+                        row[1] = repair_fake.email()
+                    self.emails.add(row[1])
+                    while row[2] in self.phones:
+                        row[2] = repair_fake.phone_number()
+                    self.phones.add(row[2])
+                self.data.extend(rows)
+
+    def upload_to_google_sheet(
+        self,
+        chunk_size=SHEET_CHUNK_ROWS,
+        worksheets=1,
+        writes_per_minute=SHEET_WRITES_PER_MINUTE,
+        max_retries=5,
+        client=None,
+    ):
+        """Uploads ``self.data`` in row chunks, spread over ``worksheets`` tabs written concurrently.
+
+        Every tab is resized once up front. Writes share one rate limiter, and rate-limit
+        or server errors are retried with exponential backoff. ``client`` can be any
+        gspread-compatible client, e.g. a local fake in tests.
+        """
+        client = client or self._authorize()
+        limiter = RateLimiter(writes_per_minute)
+
+        sheet = client.create("Fake Leads Sheet")
+        if self.share_email:
+            sheet.share(self.share_email, perm_type="user", role="writer")
+
+        per_sheet = -(-len(self.data) // max(1, worksheets)) or 1
+        parts = [self.data[start:start + per_sheet] for start in range(0, len(self.data), per_sheet)] or [[]]
+        targets = []
+        for index, rows in enumerate(parts):
+            if index == 0:
+                worksheet = sheet.get_worksheet(0)
+                self._with_backoff(lambda: worksheet.resize(rows=len(rows) + 1, cols=len(COLUMNS)), limiter, max_retries)
+            else:
+                worksheet = self._with_backoff(
+                    lambda: sheet.add_worksheet(title=f"Leads {index + 1}", rows=len(rows) + 1, cols=len(COLUMNS)),
+                    limiter,
+                    max_retries,
+                )
+            targets.append((worksheet, rows))
+
+        def upload_rows(worksheet, rows):
+            # Row 1 is the header; data chunks follow at A2, A2 + chunk_size, ...
+            self._with_backoff(lambda: worksheet.update(values=[COLUMNS], range_name="A1"), limiter, max_retries)
+            for start in range(0, len(rows), chunk_size):
+                chunk = rows[start:start + chunk_size]
+                self._with_backoff(
+                    lambda: worksheet.update(values=chunk, range_name=f"A{start + 2}"), limiter, max_retries
+                )
+
+        with ThreadPoolExecutor(max_workers=len(targets)) as executor:
+            for future in [executor.submit(upload_rows, worksheet, rows) for worksheet, rows in targets]:
+                future.result()
+
+        print(f"Data uploaded to {sheet.url}")
+        return sheet
+
+    def _authorize(self):
         scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
         creds_file = self.google_credentials
         creds = ServiceAccountCredentials.from_json_keyfile_name(creds_file, scope)
-        client = gspread.authorize(creds)
-        
-        sheet = client.create("Fake Leads Sheet")
-        sheet.share(self.share_email, perm_type="user", role="writer")
-        worksheet = sheet.get_worksheet(0)
-        worksheet.update([df.columns.values.tolist()] + df.values.tolist())
-        
-        print(f"Data uploaded to {sheet.url}")
+        return gspread.authorize(creds)
+
+    @staticmethod
+    def _with_backoff(request, limiter, max_retries):
+        for attempt in range(max_retries + 1):
+            limiter.wait()
+            try:
+                return request()
+            except gspread.exceptions.APIError as e:
+                status = e.response.status_code
+                if attempt == max_retries or (status != 429 and status < 500):
+                    raise
+                time.sleep(min(64, 2 ** attempt) + random.random())
 
 if __name__ == "__main__":
     fake_sheet = FakeSheet()
-    fake_sheet.generate_data()
-    fake_sheet.upload_to_google_sheet()
+    fake_sheet.generate_data()  # or generate_data(2_000_000, processes=os.cpu_count()) for load-test volumes
+    fake_sheet.upload_to_google_sheet()  # e.g. worksheets=4 for runs that exceed one tab
+    # fake_sheet.export_parquet("fake_leads.parquet", 50_000_000)
@@ -1,92 +1,614 @@
 from datetime import timedelta
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional
+from google.api_core import exceptions
 from google.cloud import storage
 
+from url_cache import SignedURLCache
+
 import os
+import json
+import time
+import uuid
+import base64
+import sqlite3
+import threading
+import mimetypes
+import requests
+import google_crc32c
 from dotenv import load_dotenv
 
 load_dotenv()
 bucket_name = os.getenv("BUCKET_NAME")
 google_credentials = os.getenv("GOOGLE_CREDENTIALS")
 
+DELETE_BATCH_SIZE = 100  # GCS recommends at most 100 calls per batch request
+DOWNLOAD_SLICE_SIZE = 32 * 1024 * 1024
+SLICED_DOWNLOAD_THRESHOLD = 64 * 1024 * 1024
+COMPOSITE_PART_SIZE = 32 * 1024 * 1024
+COMPOSE_MAX_SOURCES = 32  # limit of a single compose request
+RESUMABLE_CHUNK_SIZE = 8 * 1024 * 1024  # must be a multiple of 256 KiB
+RESUMABLE_TIMEOUT = (10, 120)  # (connect, read) seconds for each session request
+INDEX_FIELDS = "items(name,size,contentType,updated,crc32c,md5Hash,generation),nextPageToken"
+
+
+@dataclass
+class DeleteResult:
+    listed: int = 0
+    deleted: int = 0
+    failed: int = 0
+    elapsed: float = 0.0
+    dry_run: bool = False
+    errors: list = field(default_factory=list)  # (blob name, error message)
+
+
+@dataclass
+class UploadMetrics:
+    blob_name: str
+    mode: str
+    size: int
+    part_size: int
+    parts: int
+    bytes_sent: int
+    elapsed: float
+
+    @property
+    def throughput(self) -> float:
+        """Bytes per second sent during this call."""
+        return self.bytes_sent / self.elapsed if self.elapsed else 0.0
+
+
+@dataclass
+class DownloadResult:
+    downloaded: int = 0
+    skipped: int = 0
+    failed: int = 0
+    bytes_downloaded: int = 0
+    bytes_skipped: int = 0
+    elapsed: float = 0.0
+    errors: list = field(default_factory=list)  # (blob name, error message)
+
+
+def _file_crc32c(path: str) -> str:
+    """Returns the base64 CRC32C of a local file, in the format GCS reports for blobs."""
+    checksum = google_crc32c.Checksum()
+    with open(path, "rb") as fp:
+        for chunk in iter(lambda: fp.read(1024 * 1024), b""):
+            checksum.update(chunk)
+    return base64.b64encode(checksum.digest()).decode("utf-8")
+
+
+def _local_path(root: str, blob_name: str) -> str:
+    """Maps a blob name onto a path under ``root``, mirroring its prefixes as directories."""
+    root = os.path.abspath(root)
+    path = os.path.abspath(os.path.join(root, *blob_name.split("/")))
+    if os.path.commonpath([root, path]) != root:
+        raise ValueError(f"Blob name '{blob_name}' points outside of {root}")
+    return path
+
+
+class BlobIndex:
+    """On-disk SQLite index of blob metadata, so listings and lookups never hit the network.
+
+    It is filled from bucket listings with ``replace_prefix``; refreshing a prefix replaces
+    exactly the rows under it and leaves the rest of the index untouched. Listed prefixes
+    are remembered, so ``covers`` tells whether the index is complete for a prefix.
+    """
+
+    COLUMNS = ("name", "size", "content_type", "updated", "crc32c", "md5_hash", "generation")
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS blobs ("
+                "name TEXT PRIMARY KEY, size INTEGER, content_type TEXT, updated TEXT, "
+                "crc32c TEXT, md5_hash TEXT, generation INTEGER) WITHOUT ROWID"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS blobs_content_type ON blobs (content_type)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS prefixes (prefix TEXT PRIMARY KEY) WITHOUT ROWID")
+
+    @staticmethod
+    def row(blob) -> tuple:
+        """Converts a listed blob into an index row."""
+        updated = blob.updated.isoformat() if blob.updated else None
+        return (blob.name, blob.size, blob.content_type, updated, blob.crc32c, blob.md5_hash, blob.generation)
+
+    @staticmethod
+    def _prefix_filter(prefix):
+        # A range scan on the primary key; LIKE/GLOB would need escaping of blob names.
+        if not prefix:
+            return "1", ()
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return "name >= ? AND name < ?", (prefix, upper)
+
+    def replace_prefix(self, prefix: str, rows) -> int:
+        """Replaces every indexed blob under ``prefix`` with ``rows``; returns the row count."""
+        where, args = self._prefix_filter(prefix)
+        rows = list(rows)
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM blobs WHERE {where}", args)
+            self._conn.executemany("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.execute("INSERT OR IGNORE INTO prefixes VALUES (?)", (prefix,))
+        return len(rows)
+
+    def covers(self, prefix: str) -> bool:
+        """True if ``prefix`` lies under a prefix that has been listed into the index."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM prefixes WHERE substr(?, 1, length(prefix)) = prefix LIMIT 1", (prefix,)
+            ).fetchone()
+        return row is not None
+
+    def upsert(self, row: tuple) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?, ?)", row)
+
+    def remove(self, name: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM blobs WHERE name = ?", (name,))
+
+    def get(self, name: str) -> Optional[dict]:
+        """Returns the indexed metadata of one blob, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM blobs WHERE name = ?", (name,)).fetchone()
+        return dict(zip(self.COLUMNS, row)) if row else None
+
+    def names(self, prefix: str = "") -> list:
+        where, args = self._prefix_filter(prefix)
+        with self._lock:
+            return [row[0] for row in self._conn.execute(f"SELECT name FROM blobs WHERE {where} ORDER BY name", args)]
+
+    def total_size(self, prefix: str = "") -> int:
+        where, args = self._prefix_filter(prefix)
+        with self._lock:
+            return self._conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM blobs WHERE {where}", args).fetchone()[0]
+
+    def by_content_type(self, content_type: str, prefix: str = "") -> list:
+        where, args = self._prefix_filter(prefix)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT name FROM blobs WHERE content_type = ? AND {where} ORDER BY name", (content_type, *args)
+            )
+            return [row[0] for row in rows]
+
+    def close(self) -> None:
+        self._conn.close()
+
 
 class GCP:
-    def __init__(self):
+    def __init__(self, index_path: Optional[str] = None, url_cache_path: Optional[str] = None):
         self.storage_client = storage.Client.from_service_account_json(google_credentials)
         self.bucket = self.storage_client.bucket(bucket_name)
+        self.index = BlobIndex(index_path) if index_path else None
+        self.url_cache = SignedURLCache(path=url_cache_path)
+        self.upload_metrics = []  # one UploadMetrics per upload_to_gcs call
 
-    def upload_to_gcs(self, source_file_path: str, destination_blob_name: str) -> None:
-        """Uploads a file to Google Cloud Storage."""
-        blob = self.bucket.blob(destination_blob_name)
-        blob.upload_from_filename(source_file_path)
-        print(f"File {source_file_path} uploaded to {self.bucket.name}/{destination_blob_name}.")
+    def upload_to_gcs(
+        self,
+        source_file_path: str,
+        destination_blob_name: str,
+        mode: str = "simple",
+        part_size: Optional[int] = None,
+        max_workers: int = 8,
+        session_path: Optional[str] = None,
+    ) -> UploadMetrics:
+        """Uploads a file to Google Cloud Storage.
 
-    def generate_signed_url(self, blob_name: str) -> str:
-        """Generates a signed URL for a blob."""
-        blob = self.bucket.blob(blob_name)
-        url = blob.generate_signed_url(
-            version="v4",
-            expiration=timedelta(hours=24),
-            method="GET",
+        ``mode`` is one of:
+
+        * ``"simple"`` - a single stream (chunked by ``part_size`` if given).
+        * ``"composite"`` - parts of ``part_size`` are uploaded in parallel and joined
+          server-side with ``compose``; the temporary part objects are deleted afterwards.
+        * ``"resumable"`` - a resumable session whose URL is kept in ``session_path``
+          (``<file>.gcsupload`` by default), so a restarted process continues the upload.
+        """
+        start = time.monotonic()
+        size = os.path.getsize(source_file_path)
+        blob = None
+        if mode == "composite":
+            part_size = part_size or COMPOSITE_PART_SIZE
+            parts, bytes_sent = self._composite_upload(source_file_path, destination_blob_name, part_size, max_workers)
+        elif mode == "resumable":
+            part_size = part_size or RESUMABLE_CHUNK_SIZE
+            parts, bytes_sent = self._resumable_upload(
+                source_file_path, destination_blob_name, part_size, session_path or source_file_path + ".gcsupload"
+            )
+        elif mode == "simple":
+            blob = self.bucket.blob(destination_blob_name, chunk_size=part_size)
+            blob.upload_from_filename(source_file_path)
+            parts, bytes_sent = 1, size
+        else:
+            raise ValueError(f"Unknown upload mode: {mode}")
+        if self.index is not None:
+            # A simple upload already holds the new metadata; the other modes need one lookup.
+            self.index.upsert(BlobIndex.row(blob or self.bucket.get_blob(destination_blob_name)))
+
+        metrics = UploadMetrics(
+            blob_name=destination_blob_name,
+            mode=mode,
+            size=size,
+            part_size=part_size or size,
+            parts=parts,
+            bytes_sent=bytes_sent,
+            elapsed=time.monotonic() - start,
         )
-        return url
+        self.upload_metrics.append(metrics)
+        print(f"File {source_file_path} uploaded to {self.bucket.name}/{destination_blob_name} "
+              f"({metrics.throughput / 1e6:.1f} MB/s).")
+        return metrics
+
+    def _composite_upload(self, path, blob_name, part_size, max_workers):
+        size = os.path.getsize(path)
+        temp_prefix = f"{blob_name}.parts-{uuid.uuid4().hex}/"
+        part_count = max(1, -(-size // part_size))
+        # Every part name is scheduled for cleanup, even if its upload never finishes.
+        temp_names = [f"{temp_prefix}{index:05d}" for index in range(part_count)]
+
+        def upload_part(index):
+            offset = index * part_size
+            part = self.bucket.blob(temp_names[index])
+            with open(path, "rb") as fp:
+                fp.seek(offset)
+                part.upload_from_file(fp, size=min(part_size, size - offset))
+            return part
+
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+                sources = list(executor.map(upload_part, range(part_count)))
+
+            # compose takes at most 32 sources, so larger files are joined in rounds.
+            round_number = 0
+            while len(sources) > COMPOSE_MAX_SOURCES:
+                composed = []
+                for i in range(0, len(sources), COMPOSE_MAX_SOURCES):
+                    intermediate = self.bucket.blob(f"{temp_prefix}compose-{round_number}-{i // COMPOSE_MAX_SOURCES:05d}")
+                    intermediate.compose(sources[i:i + COMPOSE_MAX_SOURCES])
+                    temp_names.append(intermediate.name)
+                    composed.append(intermediate)
+                sources = composed
+                round_number += 1
+
+            destination = self.bucket.blob(blob_name)
+            destination.content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+            destination.compose(sources)
+            return part_count, size
+        finally:
+            for i in range(0, len(temp_names), DELETE_BATCH_SIZE):
+                self._delete_batch(temp_names[i:i + DELETE_BATCH_SIZE], retries=3)
+
+    def _resumable_upload(self, path, blob_name, chunk_size, session_path):
+        if chunk_size % (256 * 1024):
+            raise ValueError("Resumable chunk size must be a multiple of 256 KiB")
+        stat = os.stat(path)
+        session = None
+        try:
+            with open(session_path) as fp:
+                session = json.load(fp)
+        except (OSError, ValueError):
+            pass
+        if session and (session["blob_name"], session["size"], session["mtime"]) != (blob_name, stat.st_size, stat.st_mtime):
+            session = None
+
+        # The session URL authorizes the upload by itself, so plain HTTP requests are enough.
+        http = requests.Session()
+        offset = self._resumable_offset(http, session["url"], stat.st_size) if session else None
+        if offset is None:
+            blob = self.bucket.blob(blob_name)
+            url = blob.create_resumable_upload_session(
+                content_type=mimetypes.guess_type(path)[0] or "application/octet-stream",
+                size=stat.st_size,
+            )
+            session = {"url": url, "blob_name": blob_name, "size": stat.st_size, "mtime": stat.st_mtime}
+            with open(session_path, "w") as fp:
+                json.dump(session, fp)
+            offset = 0
+
+        chunks, bytes_sent, attempt = 0, 0, 0
+        with open(path, "rb") as fp:
+            while offset < stat.st_size or stat.st_size == 0:
+                fp.seek(offset)
+                data = fp.read(chunk_size)
+                end = offset + len(data) - 1
+                content_range = f"bytes {offset}-{end}/{stat.st_size}" if data else f"bytes */{stat.st_size}"
+                try:
+                    response = http.put(
+                        session["url"], data=data, headers={"Content-Range": content_range}, timeout=RESUMABLE_TIMEOUT
+                    )
+                except requests.RequestException:
+                    response = None
+                if response is not None and response.status_code in (200, 201):
+                    bytes_sent += len(data)
+                    chunks += 1
+                    break
+                if response is not None and response.status_code == 308:
+                    new_offset = self._range_end(response)
+                    bytes_sent += new_offset - offset
+                    offset = new_offset
+                    chunks += 1
+                    attempt = 0
+                    continue
+                if response is not None and response.status_code < 500 and response.status_code != 429:
+                    raise exceptions.from_http_response(response)
+                if attempt == 5:
+                    raise exceptions.ServiceUnavailable(f"Resumable upload of '{blob_name}' keeps failing")
+                time.sleep(2 ** attempt * 0.5)
+                attempt += 1
+                offset = self._resumable_offset(http, session["url"], stat.st_size)
+                if offset is None:
+                    raise exceptions.NotFound(f"Resumable session for '{blob_name}' expired")
+
+        os.remove(session_path)
+        return chunks, bytes_sent
+
+    def _resumable_offset(self, http, url, size, retries=5):
+        """Asks GCS how much of a resumable session it has stored; None if the session is gone.
+
+        Network errors, 429 and 5xx are retried; if they persist, the last one is raised.
+        """
+        for attempt in range(retries + 1):
+            try:
+                response = http.put(url, headers={"Content-Range": f"bytes */{size}"}, timeout=RESUMABLE_TIMEOUT)
+            except requests.RequestException:
+                if attempt == retries:
+                    raise
+            else:
+                if response.status_code in (200, 201):
+                    return size
+                if response.status_code == 308:
+                    return self._range_end(response)
+                if response.status_code in (404, 410):
+                    return None
+                if (response.status_code < 500 and response.status_code != 429) or attempt == retries:
+                    raise exceptions.from_http_response(response)
+            time.sleep(2 ** attempt * 0.5)
+
+    @staticmethod
+    def _range_end(response):
+        # "Range: bytes=0-N" lists what GCS has persisted; no header means nothing yet.
+        persisted = response.headers.get("Range")
+        return int(persisted.rsplit("-", 1)[1]) + 1 if persisted else 0
+
+    def generate_signed_url(
+        self, blob_name: str, expiration: timedelta = timedelta(hours=24), method: str = "GET"
+    ) -> str:
+        """Generates a signed URL for a blob, reusing a cached one while it is still valid."""
+        cache_key = (self.bucket.name, blob_name, method, int(expiration.total_seconds()))
+        return self.url_cache.get_or_sign(
+            cache_key,
+            expiration.total_seconds(),
+            lambda: self.bucket.blob(blob_name).generate_signed_url(
+                version="v4",
+                expiration=expiration,
+                method=method,
+            ),
+        )
+
+    def generate_signed_urls(
+        self, blob_names, expiration: timedelta = timedelta(hours=24), method: str = "GET"
+    ) -> dict:
+        """Returns ``{blob_name: signed_url}`` for many blobs; see ``url_cache.stats()`` for hit rates."""
+        return {name: self.generate_signed_url(name, expiration, method) for name in blob_names}
 
     def delete_blob(self, blob_name: str) -> None:
         """Deletes a blob from the bucket."""
         blob = self.bucket.blob(blob_name)
         blob.delete()
+        if self.index is not None:
+            self.index.remove(blob_name)
         print(f"Blob {blob_name} deleted.")
 
-    def delete_all_blobs(self) -> None:
-        """Deletes all blobs in the bucket."""
-        blobs = self.bucket.list_blobs()
-        for blob in blobs:
-            blob.delete()
-        print(f"All blobs in {self.bucket.name} deleted.")
-
-    def list_blobs(self) -> None:
-        """Lists all blobs in the bucket."""
-        blobs = self.bucket.list_blobs()
-        for blob in blobs:
-            print(blob.name)
-
-    def download_blob(self, blob_name: str) -> None:
-        """Downloads a blob to a local file."""
-        blob = self.bucket.blob(blob_name)
-        blob.download_to_filename(blob_name)
-
-    def download_all_blobs(self) -> None:
-        """Downloads all blobs in the bucket to local files."""
-        blobs = self.bucket.list_blobs()
-        for blob in blobs:
-            blob.download_to_filename(blob.name)
-
-    def list_blobs_with_prefix(self, prefix: str) -> None:
-        """Lists all blobs in the bucket with a given prefix."""
-        blobs = self.bucket.list_blobs(prefix=prefix)
-        for blob in blobs:
-            print(blob.name)
-
-    def get_blob_details(self, blob_name: str) -> None:
-        """Gets the details of a blob."""
-        blob = self.bucket.blob(blob_name)
-        blob.reload()  # Ensures metadata is loaded
+    def delete_all_blobs(
+        self,
+        prefix: Optional[str] = None,
+        dry_run: bool = False,
+        max_workers: int = 8,
+        batch_size: int = DELETE_BATCH_SIZE,
+        retries: int = 3,
+    ) -> DeleteResult:
+        """Deletes all blobs in the bucket (or under ``prefix``) using batch requests.
 
-        if blob.exists():
-            print(f"Blob Name: {blob.name}")
-            print(f"Size: {blob.size} bytes")
-            print(f"Content Type: {blob.content_type}")
-        else:
-            print(f"Blob '{blob_name}' does not exist.")
+        Each listing page is handed to a worker as soon as it arrives, so deletes overlap
+        the listing. Blobs from a failed batch are retried one by one with backoff.
+        With ``dry_run=True`` blobs are only counted.
+        """
+        start = time.monotonic()
+        result = DeleteResult(dry_run=dry_run)
+        blobs = self.bucket.list_blobs(prefix=prefix, page_size=1000, fields="items(name),nextPageToken")
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futures = []
+            for page in blobs.pages:
+                names = [blob.name for blob in page]
+                result.listed += len(names)
+                if not dry_run:
+                    for i in range(0, len(names), batch_size):
+                        futures.append(executor.submit(self._delete_batch, names[i:i + batch_size], retries))
+            for future in as_completed(futures):
+                deleted, errors = future.result()
+                result.deleted += deleted
+                result.failed += len(errors)
+                result.errors.extend(errors)
+
+        if self.index is not None and not dry_run:
+            if result.failed:
+                self.refresh_index(prefix or "")
+            else:
+                self.index.replace_prefix(prefix or "", [])
+        result.elapsed = time.monotonic() - start
+        return result
+
+    def _delete_batch(self, names, retries):
+        """Deletes ``names`` in one batch request; returns (deleted count, errors)."""
+        try:
+            with self.storage_client.batch():
+                for name in names:
+                    self.bucket.delete_blob(name)
+            return len(names), []
+        except exceptions.GoogleAPICallError:
+            pass
+
+        deleted, errors = 0, []
+        for name in names:
+            for attempt in range(retries + 1):
+                try:
+                    self.bucket.delete_blob(name)
+                except exceptions.NotFound:
+                    pass  # already deleted by the batch before it failed
+                except exceptions.GoogleAPICallError as e:
+                    if attempt == retries:
+                        errors.append((name, str(e)))
+                        break
+                    time.sleep(2 ** attempt * 0.5)
+                    continue
+                deleted += 1
+                break
+        return deleted, errors
+
+    def list_blobs(self) -> list:
+        """Lists the names of all blobs in the bucket."""
+        return self.list_blobs_with_prefix("")
+
+    def download_blob(self, blob_name: str, destination_dir: str = ".", max_workers: int = 8) -> str:
+        """Downloads a blob to ``destination_dir``/``blob_name`` and returns the local path."""
+        blob = self.bucket.get_blob(blob_name)
+        if blob is None:
+            raise exceptions.NotFound(f"Blob '{blob_name}' does not exist.")
+        path = _local_path(destination_dir, blob.name)
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as slice_pool:
+            self._download(blob, path, slice_pool, SLICED_DOWNLOAD_THRESHOLD, DOWNLOAD_SLICE_SIZE)
+        return path
+
+    def download_all_blobs(
+        self,
+        destination_dir: str = ".",
+        prefix: Optional[str] = None,
+        max_workers: int = 8,
+        slice_threshold: int = SLICED_DOWNLOAD_THRESHOLD,
+        slice_size: int = DOWNLOAD_SLICE_SIZE,
+    ) -> DownloadResult:
+        """Downloads all blobs in the bucket (or under ``prefix``) into ``destination_dir``.
+
+        Blob prefixes become directories. Blobs of at least ``slice_threshold`` bytes are
+        fetched as parallel byte ranges. Local files whose size and CRC32C already match
+        the blob are skipped.
+        """
+        start = time.monotonic()
+        result = DownloadResult()
+        blobs = self.bucket.list_blobs(prefix=prefix, fields="items(name,size,crc32c,generation),nextPageToken")
+
+        # Separate pools: file workers block on their slices, so they must not share workers.
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as file_pool, \
+                ThreadPoolExecutor(max_workers=max(1, max_workers)) as slice_pool:
+            futures = {}
+            for blob in blobs:
+                if blob.name.endswith("/"):
+                    continue  # folder placeholder object
+                future = file_pool.submit(self._sync_blob, blob, destination_dir, slice_pool, slice_threshold, slice_size)
+                futures[future] = blob
+            for future in as_completed(futures):
+                blob = futures[future]
+                try:
+                    downloaded = future.result()
+                except Exception as e:
+                    result.failed += 1
+                    result.errors.append((blob.name, str(e)))
+                    continue
+                if downloaded:
+                    result.downloaded += 1
+                    result.bytes_downloaded += blob.size or 0
+                else:
+                    result.skipped += 1
+                    result.bytes_skipped += blob.size or 0
+
+        result.elapsed = time.monotonic() - start
+        return result
+
+    def _sync_blob(self, blob, destination_dir, slice_pool, slice_threshold, slice_size) -> bool:
+        """Downloads ``blob`` unless an identical local copy exists; returns True if it downloaded."""
+        path = _local_path(destination_dir, blob.name)
+        if (
+            os.path.isfile(path)
+            and os.path.getsize(path) == blob.size
+            and blob.crc32c
+            and _file_crc32c(path) == blob.crc32c
+        ):
+            return False
+        self._download(blob, path, slice_pool, slice_threshold, slice_size)
+        return True
+
+    def _download(self, blob, path, slice_pool, slice_threshold, slice_size) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + ".download"
+        try:
+            if blob.size is None or blob.size < slice_threshold:
+                blob.download_to_filename(temp_path)  # the client validates the checksum itself
+            else:
+                with open(temp_path, "wb") as fp:
+                    fp.truncate(blob.size)
+
+                def fetch_slice(offset):
+                    with open(temp_path, "r+b") as fp:
+                        fp.seek(offset)
+                        blob.download_to_file(fp, start=offset, end=min(offset + slice_size, blob.size) - 1)
+
+                for future in [slice_pool.submit(fetch_slice, o) for o in range(0, blob.size, slice_size)]:
+                    future.result()
+                if blob.crc32c and _file_crc32c(temp_path) != blob.crc32c:
+                    raise ValueError(f"CRC32C mismatch for '{blob.name}'")
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def list_blobs_with_prefix(self, prefix: str) -> list:
+        """Lists the names of all blobs in the bucket with a given prefix.
+
+        With an index, prefixes that ``refresh_index`` has listed are answered locally;
+        anything else still goes to the network.
+        """
+        if self.index is not None and self.index.covers(prefix):
+            return self.index.names(prefix)
+        blobs = self.bucket.list_blobs(prefix=prefix or None, fields="items(name),nextPageToken")
+        return [blob.name for blob in blobs]
+
+    def get_blob_details(self, blob_name: str) -> Optional[dict]:
+        """Gets the details of a blob, or None if it does not exist."""
+        if self.index is not None:
+            details = self.index.get(blob_name)
+            if details is not None:
+                return details
+        blob = self.bucket.get_blob(blob_name)  # one request; None if the blob is missing
+        if blob is None:
+            return None
+        row = BlobIndex.row(blob)
+        if self.index is not None:
+            self.index.upsert(row)
+        return dict(zip(BlobIndex.COLUMNS, row))
+
+    def refresh_index(self, prefix: str = "") -> int:
+        """Re-lists ``prefix`` (the whole bucket by default) into the metadata index."""
+        if self.index is None:
+            raise RuntimeError("GCP was created without an index_path")
+        blobs = self.bucket.list_blobs(prefix=prefix or None, fields=INDEX_FIELDS)
+        return self.index.replace_prefix(prefix, (BlobIndex.row(blob) for blob in blobs))
 
 
 
 if __name__ == "__main__":
-    gcp = GCP()
+    gcp = GCP(index_path="gcp_index.sqlite3", url_cache_path="gcp_signed_urls.json")
     # gcp.upload_to_gcs("/home/mothilal/Downloads/Java For Programmers in 2 hours - Telusko (720p, h264) (1).mp4", "courses/java-video.mp4")
+    # gcp.upload_to_gcs("/home/mothilal/Downloads/course.mp4", "courses/course.mp4", mode="composite", part_size=64 * 1024 * 1024)
     print(gcp.generate_signed_url("courses/java-video.mp4"))
+    # print(gcp.generate_signed_urls(gcp.list_blobs_with_prefix("courses/333/")), gcp.url_cache.stats())
     # gcp.delete_blob("video.mp4")
-    # gcp.get_blob_details("courses/333/modules/592/materials/Learn React Router with a Beginners Project  Learn React JS - Dave Gray (720p, h264).mp4")
+    # print(gcp.delete_all_blobs(prefix="courses/333/", dry_run=True))
+    # print(gcp.get_blob_details("courses/333/modules/592/materials/Learn React Router with a Beginners Project  Learn React JS - Dave Gray (720p, h264).mp4"))
     # gcp.download_blob("video.mp4")
-    # gcp.download_all_blobs()
-    # gcp.list_blobs()
-    # gcp.list_blobs_with_prefix("video")
+    # print(gcp.download_all_blobs("downloads", prefix="courses/333/"))
+    # gcp.refresh_index()
+    # print(gcp.list_blobs())
+    # print(gcp.list_blobs_with_prefix("video"), gcp.index.total_size("video"))
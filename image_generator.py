@@ -1,46 +1,262 @@
 import os
+import json
+import time
+import random
+import hashlib
+import threading
+from dataclasses import dataclass
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
 from dotenv import load_dotenv
-import replicate
 
-# load_dotenv()
-# api_key = os.getenv("REPLICATE_API_TOKEN")
+from rate_limit import RateLimiter
 
-# os.environ["REPLICATE_API_TOKEN"] = api_key
+STABILITY_BASE_URL = "https://api.stability.ai"
+REPLICATE_BASE_URL = "https://api.replicate.com"
+DEFAULT_MODELS = {"stability": "ultra", "replicate": "black-forest-labs/flux-pro"}
+# (calls, period in seconds), from the providers' published limits
+DEFAULT_RATE_LIMITS = {"stability": (150, 10.0), "replicate": (600, 60.0)}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Generation POSTs are billed once accepted, so they are retried only when they cannot have been
+POST_RETRY_STATUSES = {429}
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def _never_connected(error):
+    """True if a request failed before reaching the server (DNS, refused or timed-out connect)."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0] if error.args else None, "reason", None)
+    return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+
+class ImageGenerationError(Exception):
+    """The provider rejected the request or the prediction failed."""
+
+
+@dataclass
+class ImageResult:
+    provider: str
+    model: str
+    prompt: str
+    path: Optional[str] = None
+    cached: bool = False  # served from disk without any request
+    elapsed: float = 0.0
+    error: Optional[str] = None
 
-import requests
 
 class ImageGenerator:
-    def __init__(self):
-        self.replicate_api_key = "xx"
-        self.stability_api_key = "xx"
-
-    def generate_replicate_image(self, prompt: str):
-        output = replicate.run(
-            "black-forest-labs/flux-pro",
-            input={"prompt": prompt}
-        )
-        return output
-    
-    def generate_stability_image(self, prompt: str):
-        response = requests.post(
-            f"https://api.stability.ai/v2beta/stable-image/generate/ultra",
-            headers={
-                "authorization": f"Bearer {self.stability_api_key}",
-                "accept": "image/*"
-            },
+    """Generates images through Stability AI and Replicate over one pooled HTTP session.
+
+    Outputs are content-addressed: the file name is a hash of (provider, model, prompt,
+    params), so a repeated prompt is served from ``output_dir`` without touching the
+    network, and identical requests in flight at the same time are sent once. Requests
+    are rate limited per provider and retried with exponential backoff on 429 and 5xx;
+    generation POSTs are retried only on 429 and failed connections, so a job the
+    provider may already have accepted is never paid for twice.
+    Both base URLs can point at a local stub server.
+    """
+
+    def __init__(
+        self,
+        replicate_api_key=None,
+        stability_api_key=None,
+        output_dir="generated_images",
+        stability_base_url=STABILITY_BASE_URL,
+        replicate_base_url=REPLICATE_BASE_URL,
+        rate_limits=None,
+        max_retries=4,
+        backoff_s=1.0,
+        timeout_s=120,
+        poll_interval_s=1.0,
+        pool_size=16,
+    ):
+        self.replicate_api_key = replicate_api_key or os.getenv("REPLICATE_API_TOKEN", "xx")
+        self.stability_api_key = stability_api_key or os.getenv("STABILITY_API_KEY", "xx")
+        self.output_dir = output_dir
+        self.base_urls = {"stability": stability_base_url.rstrip("/"), "replicate": replicate_base_url.rstrip("/")}
+        self.max_retries = max_retries
+        self.backoff_s = backoff_s
+        self.timeout_s = timeout_s
+        self.poll_interval_s = poll_interval_s
+        self.pool_size = pool_size
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._limiters = {
+            provider: RateLimiter(calls, period) for provider, (calls, period) in {**DEFAULT_RATE_LIMITS, **(rate_limits or {})}.items()
+        }
+        self._lock = threading.Lock()
+        self._in_flight = {}  # path -> Future
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    def generate_replicate_image(self, prompt: str, model: str = DEFAULT_MODELS["replicate"], **params) -> str:
+        """Returns the path of the image for ``prompt``; ``params`` are extra model inputs."""
+        return self._generate("replicate", model, prompt, params)
+
+    def generate_stability_image(self, prompt: str, model: str = DEFAULT_MODELS["stability"], **params) -> str:
+        """Returns the path of the image for ``prompt``; ``model`` is "ultra", "core" or "sd3"."""
+        return self._generate("stability", model, prompt, params)
+
+    def generate_batch(self, prompts, provider="stability", model=None, params=None, max_workers=None):
+        """Generates every prompt concurrently; returns one ImageResult per prompt, in order.
+
+        Failures are reported in ``ImageResult.error`` instead of raising.
+        """
+        model = model or DEFAULT_MODELS[provider]
+        params = params or {}
+
+        def run(prompt):
+            start = time.monotonic()
+            cached = os.path.exists(self.output_path(provider, model, prompt, params))
+            try:
+                path = self._generate(provider, model, prompt, params)
+            except Exception as e:
+                return ImageResult(provider, model, prompt, elapsed=time.monotonic() - start, error=str(e))
+            return ImageResult(provider, model, prompt, path, cached, time.monotonic() - start)
+
+        with ThreadPoolExecutor(max_workers=max_workers or self.pool_size) as executor:
+            return list(executor.map(run, prompts))
+
+    def output_path(self, provider, model, prompt, params):
+        key = json.dumps([provider, model, prompt, params], sort_keys=True)
+        extension = params.get("output_format", "webp")
+        return os.path.join(self.output_dir, provider, f"{hashlib.sha256(key.encode('utf-8')).hexdigest()}.{extension}")
+
+    def _generate(self, provider, model, prompt, params):
+        path = self.output_path(provider, model, prompt, params)
+        if os.path.exists(path):
+            return path
+        with self._lock:
+            if os.path.exists(path):  # finished between the check above and taking the lock
+                return path
+            future = self._in_flight.get(path)
+            owner = future is None
+            if owner:
+                future = self._in_flight[path] = Future()
+        if not owner:
+            return future.result()
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if provider == "stability":
+                self._stability(model, prompt, params, path)
+            elif provider == "replicate":
+                self._replicate(model, prompt, params, path)
+            else:
+                raise ValueError(f"Unknown provider: {provider}")
+            future.set_result(path)
+            return path
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(path, None)
+
+    def _stability(self, model, prompt, params, path):
+        response = self._request(
+            "stability",
+            "POST",
+            f"{self.base_urls['stability']}/v2beta/stable-image/generate/{model}",
+            headers={"authorization": f"Bearer {self.stability_api_key}", "accept": "image/*"},
             files={"none": ''},
-            data={
-                "prompt": prompt,
-                "output_format": "webp",
-            },
+            data={"output_format": "webp", **params, "prompt": prompt},
+            stream=True,
+        )
+        self._save(response, path)
+
+    def _replicate(self, model, prompt, params, path):
+        headers = {"Authorization": f"Bearer {self.replicate_api_key}"}
+        response = self._request(
+            "replicate",
+            "POST",
+            f"{self.base_urls['replicate']}/v1/models/{model}/predictions",
+            headers={**headers, "Prefer": "wait"},  # hold the connection until done (up to 60s)
+            json={"input": {**params, "prompt": prompt}},
         )
+        prediction = response.json()
+        deadline = time.monotonic() + self.timeout_s
+        while prediction["status"] not in ("succeeded", "failed", "canceled"):
+            if time.monotonic() > deadline:
+                raise ImageGenerationError(f"Replicate prediction {prediction.get('id')} timed out")
+            time.sleep(self.poll_interval_s)
+            prediction = self._request("replicate", "GET", prediction["urls"]["get"], headers=headers, limit=False).json()
+        if prediction["status"] != "succeeded":
+            raise ImageGenerationError(f"Replicate prediction {prediction['status']}: {prediction.get('error')}")
+
+        output = prediction["output"]
+        url = output[0] if isinstance(output, list) else output
+        self._save(self._request("replicate", "GET", url, limit=False, stream=True), path)
+
+    def _request(self, provider, method, url, limit=True, **kwargs):
+        """Sends a request, retrying with exponential backoff.
+
+        GETs are retried on connection errors, timeouts, 429 and 5xx. POSTs are retried only
+        when the connection could not be made or on 429, where the provider did no work.
+        """
+        idempotent = method != "POST"
+        retry_statuses = RETRY_STATUSES if idempotent else POST_RETRY_STATUSES
+        for attempt in range(self.max_retries + 1):
+            if limit:
+                self._limiters[provider].wait()
+            try:
+                response = self.session.request(method, url, timeout=self.timeout_s, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                # A read timeout or dropped connection after the body was sent may have started a job
+                if not (idempotent or _never_connected(e)) or attempt == self.max_retries:
+                    raise
+                time.sleep(self.backoff_s * 2 ** attempt * random.uniform(0.5, 1.5))
+                continue
+
+            if response.status_code < 400:
+                return response
+            if response.status_code not in retry_statuses or attempt == self.max_retries:
+                try:
+                    detail = response.json()
+                except ValueError:
+                    detail = response.text[:500]
+                response.close()
+                raise ImageGenerationError(f"{provider} returned {response.status_code}: {detail}")
+            retry_after = response.headers.get("Retry-After")
+            response.close()
+            if retry_after and retry_after.isdigit():
+                time.sleep(float(retry_after))
+            else:
+                time.sleep(self.backoff_s * 2 ** attempt * random.uniform(0.5, 1.5))
+
+    @staticmethod
+    def _save(response, path):
+        """Streams the response body to ``path``; readers never see a partial file."""
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with response, open(temp_path, "wb") as file:
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    file.write(chunk)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
 
-        if response.status_code == 200:
-            with open("./ai_image.webp", 'wb') as file:
-                file.write(response.content)
-        else:
-            raise Exception(str(response.json()))
-        
 
-image_gen = ImageGenerator()
-image_gen.generate_stability_image("walking laptop on the beach")
+if __name__ == "__main__":
+    load_dotenv()
+    image_gen = ImageGenerator()
+    print(image_gen.generate_stability_image("walking laptop on the beach"))
+    # print(image_gen.generate_replicate_image("walking laptop on the beach"))
+    # for result in image_gen.generate_batch(["a red fox", "a lighthouse at dusk"], provider="stability"):
+    #     print(result)
@@ -0,0 +1,65 @@
+import re
+
+from llm_client import LLMBlockedError, LLMEmptyResponseError, LLMParseError
+
+# --- Interview Questions ---
+# Add more diverse questions (behavioral, technical, situational)
+QUESTIONS = [
+    {"text": "Tell me about yourself.", "type": "General", "format": None},
+    {"text": "What are your biggest strengths?", "type": "General", "format": None},
+    {"text": "What are your biggest weaknesses?", "type": "General", "format": None},
+    {"text": "Describe a challenging project you worked on and how you handled it. Please use the STAR method.", "type": "Behavioral", "format": "STAR"},
+    {"text": "Where do you see yourself in 5 years?", "type": "General", "format": None},
+    {"text": "Why are you interested in this type of role?", "type": "General", "format": None},
+    {"text": "Tell me about a time you had a conflict with a coworker.", "type": "Behavioral", "format": None},
+    {"text": "Explain the difference between a list and a tuple in Python.", "type": "Technical", "format": None},
+    {"text": "What is Object-Oriented Programming?", "type": "Technical", "format": None},
+]
+
+# --- Fixed Prompts ---
+# Everything the interviewer says verbatim, so it can be synthesized once and cached.
+GREETING = "Hello! Welcome to your AI-powered mock interview."
+INSTRUCTIONS = "I will ask you a series of questions. Please answer clearly after the beep sound would normally be... just kidding, answer after I stop talking."
+NO_SPEECH = "I didn't hear anything. Let's move on."
+NOT_UNDERSTOOD = "Sorry, I couldn't understand that."
+TRY_DIFFERENT = "Okay, let's try a different question then."
+CLOSING = "That concludes our mock interview session. Thank you for participating! Remember to reflect on the feedback."
+FALLBACK_TRANSITION = "Okay, let's proceed."
+BLOCKED_RESPONSE = "My response was blocked due to safety settings. Let's move to the next question."
+EMPTY_RESPONSE = "I couldn't generate feedback for that response. Let's continue."
+UNPARSED_RESPONSE = "Interesting. Let's move on to the next topic."
+AI_ERROR = "I encountered an error processing that. Let's move to the next question."
+NEXT_QUESTION = "Let's move to the next question."
+
+FIXED_PROMPTS = [
+    GREETING, INSTRUCTIONS, NO_SPEECH, NOT_UNDERSTOOD, TRY_DIFFERENT, CLOSING,
+    FALLBACK_TRANSITION, BLOCKED_RESPONSE, EMPTY_RESPONSE, UNPARSED_RESPONSE, AI_ERROR, NEXT_QUESTION,
+]
+
+
+def split_sentences(text):
+    """Splits text into sentences so each one can be synthesized and played on its own."""
+    return [sentence for sentence in re.split(r"(?<=[.!?])\s+", text.strip()) if sentence]
+
+
+def feedback_turn(llm, question_data, answer):
+    """Returns ``(feedback, follow_up)`` for an answer, falling back to a fixed prompt on errors."""
+    try:
+        result = llm.feedback(question_data, answer)
+    except LLMBlockedError as e:
+        print(f"WARN: Gemini response blocked due to: {e}")
+        return BLOCKED_RESPONSE, None
+    except LLMEmptyResponseError:
+        print("WARN: Gemini returned an empty response.")
+        return EMPTY_RESPONSE, None
+    except LLMParseError:
+        print("WARN: Could not parse feedback/follow-up structure from Gemini response. Using generic transition.")
+        return UNPARSED_RESPONSE, None
+    except Exception as e:
+        print(f"ERROR interacting with Google AI: {e}")
+        return AI_ERROR, None
+
+    if not result.follow_up:
+        # If feedback was found but no follow-up, create a transition
+        return f"{result.feedback} {NEXT_QUESTION}", None
+    return result.feedback, result.follow_up
@@ -0,0 +1,464 @@
+import io
+import os
+import re
+import json
+import time
+import uuid
+import wave
+import random
+import asyncio
+import argparse
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import ClientSession, TCPConnector, WSMsgType, web
+
+from interview_script import (
+    QUESTIONS, GREETING, INSTRUCTIONS, NO_SPEECH, NOT_UNDERSTOOD, TRY_DIFFERENT, CLOSING,
+    FALLBACK_TRANSITION, feedback_turn, split_sentences,
+)
+from interview_trace import Tracer, percentile
+from llm_client import LLMClient
+
+AUDIO_NAME = re.compile(r"^[0-9a-f]{64}\.mp3$")
+
+
+class StubModel:
+    """Stands in for Gemini in load tests: answers in JSON after a random delay, without network."""
+
+    def __init__(self, latency_s=0.5, jitter_s=0.2, follow_up_rate=0.4, seed=None):
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.follow_up_rate = follow_up_rate
+        self._random = random.Random(seed)
+
+    def generate_content(self, prompt, **kwargs):
+        time.sleep(max(0.0, self._random.uniform(self.latency_s - self.jitter_s, self.latency_s + self.jitter_s)))
+        follow_up = "Can you give a concrete example of that?" if self._random.random() < self.follow_up_rate else None
+        return _StubResponse(json.dumps({"feedback": "Good answer. Try to quantify the result.", "follow_up": follow_up}))
+
+
+class _StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class Session:
+    """One candidate's interview: the question deck and where they are in it."""
+
+    __slots__ = ("id", "deck", "index", "follow_up", "follow_ups", "busy", "last_active")
+
+    def __init__(self, session_id, deck):
+        self.id = session_id
+        self.deck = deck  # bytes of indexes into QUESTIONS
+        self.index = 0
+        self.follow_up = None  # pending follow-up question text
+        self.follow_ups = 0  # follow-ups asked about the current deck question
+        self.busy = False
+        self.last_active = time.monotonic()
+
+    @property
+    def done(self):
+        return self.index >= len(self.deck)
+
+    def question(self):
+        question_data = QUESTIONS[self.deck[self.index]]
+        if self.follow_up:
+            return {"text": self.follow_up, "type": question_data['type'], "format": None}
+        return question_data
+
+    def advance(self, follow_up, max_follow_ups):
+        if follow_up and self.follow_ups < max_follow_ups:
+            self.follow_up = follow_up
+            self.follow_ups += 1
+        else:
+            self.follow_up = None
+            self.follow_ups = 0
+            self.index += 1
+
+
+class InterviewEngine:
+    """Runs many interviews at once on one event loop.
+
+    All sessions share one LLMClient (so its cache and hedging work across candidates),
+    one AudioCache and one speech backend. Blocking model, synthesis and recognition
+    calls run on a bounded thread pool; a session itself is a few slots of state.
+    """
+
+    def __init__(
+        self,
+        llm=None,
+        audio_cache=None,
+        stt_backend=None,
+        deck_size=5,
+        max_follow_ups=2,
+        max_sessions=1000,
+        idle_timeout_s=900,
+        workers=64,
+        tracer=None,
+    ):
+        self.llm = llm
+        self.audio_cache = audio_cache
+        self.stt_backend = stt_backend
+        self.deck_size = min(deck_size, len(QUESTIONS))
+        self.max_follow_ups = max_follow_ups
+        self.max_sessions = max_sessions
+        self.idle_timeout_s = idle_timeout_s
+        self.tracer = tracer or Tracer(max_spans=100000)
+        self.sessions = {}
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="engine")
+
+    def start(self):
+        """Creates a session and returns it with the interviewer's opening lines."""
+        if len(self.sessions) >= self.max_sessions:
+            self.expire_idle()
+            if len(self.sessions) >= self.max_sessions:
+                raise web.HTTPServiceUnavailable(reason="Too many active interviews")
+        session = Session(uuid.uuid4().hex, bytes(random.sample(range(len(QUESTIONS)), k=self.deck_size)))
+        self.sessions[session.id] = session
+        return session, [GREETING, INSTRUCTIONS, session.question()['text']]
+
+    def get(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise web.HTTPNotFound(reason="Unknown or expired session")
+        return session
+
+    def end(self, session_id):
+        self.sessions.pop(session_id, None)
+
+    async def answer(self, session, text):
+        """Handles one answer (``None`` if nothing was heard) and returns what to say next."""
+        if session.busy:
+            raise web.HTTPConflict(reason="The previous answer is still being processed")
+        if session.done:
+            raise web.HTTPGone(reason="The interview is over")
+        session.busy = True
+        try:
+            with self.tracer.span("turn"):
+                if not text:
+                    say = [NOT_UNDERSTOOD if text == "" else NO_SPEECH, TRY_DIFFERENT]
+                    follow_up = None
+                elif self.llm is None:
+                    say, follow_up = [FALLBACK_TRANSITION], None
+                else:
+                    loop = asyncio.get_running_loop()
+                    feedback, follow_up = await loop.run_in_executor(
+                        self._executor, feedback_turn, self.llm, session.question(), text
+                    )
+                    say = [feedback]
+                session.advance(follow_up, self.max_follow_ups)
+        finally:
+            session.busy = False
+            session.last_active = time.monotonic()
+        say.append(CLOSING if session.done else session.question()['text'])
+        if session.done:
+            self.end(session.id)
+        return say
+
+    async def transcribe(self, wav_bytes):
+        """Recognizes an uploaded mono 16-bit WAV answer; "" if no words were heard."""
+        if self.stt_backend is None:
+            raise web.HTTPBadRequest(reason="Audio answers are not enabled on this server")
+        try:
+            with wave.open(io.BytesIO(wav_bytes), "rb") as wav:
+                if wav.getnchannels() != 1 or wav.getsampwidth() != 2:
+                    raise web.HTTPBadRequest(reason="Audio must be mono 16-bit PCM WAV")
+                pcm, sample_rate = wav.readframes(wav.getnframes()), wav.getframerate()
+        except (wave.Error, EOFError):
+            raise web.HTTPBadRequest(reason="Audio must be mono 16-bit PCM WAV")
+        loop = asyncio.get_running_loop()
+        with self.tracer.span("recognize", audio_ms=len(pcm) * 500 // sample_rate):
+            return await loop.run_in_executor(self._executor, self.stt_backend.transcribe, pcm, sample_rate)
+
+    async def audio_for(self, say):
+        """Returns the cached audio file names for every sentence in ``say``."""
+        if self.audio_cache is None:
+            return []
+        futures = [self.audio_cache.fetch(sentence) for text in say for sentence in split_sentences(text)]
+        with self.tracer.span("tts.synthesize", sentences=len(futures)):
+            paths = await asyncio.gather(*(asyncio.wrap_future(future) for future in futures))
+        return [os.path.basename(path) for path in paths]
+
+    def expire_idle(self):
+        cutoff = time.monotonic() - self.idle_timeout_s
+        for session_id in [s.id for s in self.sessions.values() if s.last_active < cutoff and not s.busy]:
+            del self.sessions[session_id]
+
+    def stats(self):
+        return {
+            "sessions": len(self.sessions),
+            "hedges_sent": self.llm.hedges_sent if self.llm else 0,
+            "stages": self.tracer.summary(),
+        }
+
+
+# --- HTTP / WebSocket API ---
+
+async def _reply(engine, session, say, with_audio):
+    reply = {"session_id": session.id, "say": say, "done": session.done}
+    if with_audio:
+        reply["audio"] = [f"/audio/{name}" for name in await engine.audio_for(say)]
+    return reply
+
+
+def _answer_text(data):
+    """Returns the answer in a ``{"text": ...}`` JSON document; malformed input is a 400."""
+    try:
+        body = json.loads(data)
+    except ValueError:
+        raise web.HTTPBadRequest(reason="Body is not valid JSON")
+    text = body.get("text") if isinstance(body, dict) else None
+    if not isinstance(body, dict) or (text is not None and not isinstance(text, str)):
+        raise web.HTTPBadRequest(reason='Expected a JSON object with a string "text" field')
+    return (text or "").strip() or None
+
+
+async def _read_answer(engine, request):
+    if request.content_type in ("audio/wav", "audio/x-wav", "audio/wave"):
+        return await engine.transcribe(await request.read())
+    return _answer_text(await request.text())
+
+
+async def create_session(request):
+    engine = request.app["engine"]
+    session, say = engine.start()
+    return web.json_response(await _reply(engine, session, say, "audio" in request.query), status=201)
+
+
+async def post_answer(request):
+    engine = request.app["engine"]
+    session = engine.get(request.match_info["session_id"])
+    say = await engine.answer(session, await _read_answer(engine, request))
+    return web.json_response(await _reply(engine, session, say, "audio" in request.query))
+
+
+async def delete_session(request):
+    request.app["engine"].end(request.match_info["session_id"])
+    return web.Response(status=204)
+
+
+async def interview_socket(request):
+    """One interview per connection: text frames carry ``{"text": ...}``, binary frames a WAV answer."""
+    engine = request.app["engine"]
+    session, say = engine.start()
+    ws = web.WebSocketResponse(heartbeat=30)
+    await ws.prepare(request)
+    with_audio = "audio" in request.query
+    try:
+        await ws.send_json(await _reply(engine, session, say, with_audio))
+        async for message in ws:
+            try:
+                if message.type == WSMsgType.BINARY:
+                    answer = await engine.transcribe(message.data)
+                elif message.type == WSMsgType.TEXT:
+                    answer = _answer_text(message.data)
+                else:
+                    break
+                say = await engine.answer(session, answer)
+            except web.HTTPException as e:
+                await ws.send_json({"session_id": session.id, "error": e.reason})
+                continue
+            await ws.send_json(await _reply(engine, session, say, with_audio))
+            if session.done:
+                break
+    finally:
+        engine.end(session.id)
+        await ws.close()
+    return ws
+
+
+async def get_audio(request):
+    name = request.match_info["name"]
+    engine = request.app["engine"]
+    if engine.audio_cache is None or not AUDIO_NAME.match(name):
+        raise web.HTTPNotFound()
+    path = os.path.join(engine.audio_cache.cache_dir, name)
+    if not os.path.exists(path):
+        raise web.HTTPNotFound()
+    return web.FileResponse(path, headers={"Content-Type": "audio/mpeg", "Cache-Control": "public, max-age=86400"})
+
+
+async def get_stats(request):
+    return web.json_response(request.app["engine"].stats())
+
+
+async def _expire_sessions(app):
+    async def sweep():
+        while True:
+            await asyncio.sleep(60)
+            app["engine"].expire_idle()
+
+    task = asyncio.create_task(sweep())
+    yield
+    task.cancel()
+
+
+def make_app(engine):
+    app = web.Application(client_max_size=20 * 1024 * 1024)
+    app["engine"] = engine
+    app.cleanup_ctx.append(_expire_sessions)
+    app.router.add_post("/sessions", create_session)
+    app.router.add_post("/sessions/{session_id}/answer", post_answer)
+    app.router.add_delete("/sessions/{session_id}", delete_session)
+    app.router.add_get("/ws", interview_socket)
+    app.router.add_get("/audio/{name}", get_audio)
+    app.router.add_get("/stats", get_stats)
+    return app
+
+
+def make_engine(stub=False, stub_latency_s=0.5, tts=False, stt=None, vosk_model_path=None, workers=64):
+    """Builds an engine with Gemini (GOOGLE_API_KEY) or, with ``stub=True``, the StubModel."""
+    if stub:
+        model = StubModel(latency_s=stub_latency_s, jitter_s=stub_latency_s / 2)
+    else:
+        import google.generativeai as genai
+
+        genai.configure(api_key=os.environ["GOOGLE_API_KEY"])
+        model = genai.GenerativeModel('gemini-pro')
+    tracer = Tracer(max_spans=100000)
+    llm = LLMClient(model, workers=workers * 2, tracer=tracer)
+
+    audio_cache = None
+    if tts:
+        from tts_cache import DEFAULT_CACHE_DIR, AudioCache
+
+        audio_cache = AudioCache(cache_dir=os.getenv("TTS_CACHE_DIR", DEFAULT_CACHE_DIR), workers=8)
+    stt_backend = None
+    if stt:
+        from speech_stream import make_backend
+
+        stt_backend = make_backend(stt, **({"model_path": vosk_model_path} if stt == "vosk" else {}))
+    return InterviewEngine(llm, audio_cache, stt_backend, workers=workers, tracer=tracer)
+
+
+# --- Load testing ---
+
+@dataclass
+class LoadReport:
+    sessions: int
+    turns: int
+    errors: int
+    elapsed: float
+    p50_ms: float
+    p95_ms: float
+
+    @property
+    def turns_per_second(self) -> float:
+        return self.turns / self.elapsed if self.elapsed else 0.0
+
+
+async def load_test(base_url, sessions=200, concurrency=200, transport="http", think_s=0.0):
+    """Drives ``sessions`` synthetic candidates through whole interviews and times every answer."""
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    def answer_text(n, turn):
+        return f"Candidate {n}, answer {turn}: I led a team of four and shipped the project two weeks early."
+
+    async def over_http(http, n):
+        async with http.post(f"{base_url}/sessions") as response:
+            reply = await response.json()
+        turn = 0
+        while not reply["done"]:
+            await asyncio.sleep(think_s)
+            start = time.perf_counter()
+            async with http.post(f"{base_url}/sessions/{reply['session_id']}/answer", json={"text": answer_text(n, turn)}) as response:
+                response.raise_for_status()
+                reply = await response.json()
+            latencies.append(time.perf_counter() - start)
+            turn += 1
+
+    async def over_websocket(http, n):
+        async with http.ws_connect(f"{base_url}/ws") as ws:
+            reply = await ws.receive_json()
+            turn = 0
+            while not reply["done"]:
+                await asyncio.sleep(think_s)
+                start = time.perf_counter()
+                await ws.send_json({"text": answer_text(n, turn)})
+                reply = await ws.receive_json()
+                if "error" in reply:
+                    raise RuntimeError(reply["error"])
+                latencies.append(time.perf_counter() - start)
+                turn += 1
+
+    run_one = over_websocket if transport == "ws" else over_http
+    start = time.perf_counter()
+    async with ClientSession(connector=TCPConnector(limit=concurrency)) as http:
+        async def candidate(n):
+            nonlocal errors
+            async with semaphore:
+                try:
+                    await run_one(http, n)
+                except Exception as e:
+                    errors += 1
+                    print(f"Candidate {n} failed: {e!r}")
+
+        await asyncio.gather(*(candidate(n) for n in range(sessions)))
+    latencies_ms = [latency * 1000 for latency in latencies] or [0.0]
+    return LoadReport(
+        sessions, len(latencies), errors, time.perf_counter() - start,
+        round(percentile(latencies_ms, 0.5), 1), round(percentile(latencies_ms, 0.95), 1),
+    )
+
+
+async def bench(sessions, concurrency, transport, stub_latency_s, workers):
+    """Starts a stub-model server on a free local port and load-tests it."""
+    engine = make_engine(stub=True, stub_latency_s=stub_latency_s, workers=workers)
+    runner = web.AppRunner(make_app(engine))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    try:
+        report = await load_test(f"http://127.0.0.1:{port}", sessions, concurrency, transport)
+    finally:
+        await runner.cleanup()
+    return report, engine.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent mock interview server and load tester")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="run the interview server")
+    serve.add_argument("--host", default="0.0.0.0")
+    serve.add_argument("--port", type=int, default=8080)
+    serve.add_argument("--stub", action="store_true", help="use the stub model instead of Gemini")
+    serve.add_argument("--stub-latency", type=float, default=0.5)
+    serve.add_argument("--tts", action="store_true", help="synthesize replies (?audio in requests)")
+    serve.add_argument("--stt", choices=["google", "vosk"], help="accept WAV answers")
+    serve.add_argument("--vosk-model", default=os.getenv("VOSK_MODEL_PATH"))
+    serve.add_argument("--workers", type=int, default=64)
+
+    load = commands.add_parser("load", help="drive a running server with synthetic candidates")
+    load.add_argument("--url", default="http://127.0.0.1:8080")
+
+    local = commands.add_parser("bench", help="load-test an in-process stub server")
+    local.add_argument("--stub-latency", type=float, default=0.5)
+    local.add_argument("--workers", type=int, default=64)
+
+    for command in (load, local):
+        command.add_argument("--sessions", type=int, default=200)
+        command.add_argument("--concurrency", type=int, default=200)
+        command.add_argument("--transport", choices=["http", "ws"], default="http")
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        engine = make_engine(args.stub, args.stub_latency, args.tts, args.stt, args.vosk_model, args.workers)
+        web.run_app(make_app(engine), host=args.host, port=args.port)
+    elif args.command == "load":
+        print(asyncio.run(load_test(args.url, args.sessions, args.concurrency, args.transport)))
+    else:
+        report, stats = asyncio.run(bench(args.sessions, args.concurrency, args.transport, args.stub_latency, args.workers))
+        print(f"{report}  ({report.turns_per_second:.1f} turns/s)")
+        print(json.dumps(stats["stages"], indent=2))
+
+
+if __name__ == "__main__":
+    main()
+    # python interview_server.py serve --stub
+    # python interview_server.py load --url http://127.0.0.1:8080 --sessions 300 --transport ws
+    # python interview_server.py bench --sessions 300 --stub-latency 0.3
@@ -0,0 +1,97 @@
+import os
+import json
+import math
+import time
+import threading
+import collections
+from contextlib import contextmanager
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class Tracer:
+    """Records timed spans of an interview session and reports where the time went.
+
+    Spans can be recorded from any thread. ``summary()`` gives count, p50, p95, max
+    and total per span name, and ``export()`` writes a Chrome trace (open it in
+    chrome://tracing or https://ui.perfetto.dev) with the summary under "otherData".
+    """
+
+    def __init__(self, enabled=True, max_spans=None):
+        self.enabled = enabled
+        # (name, start, duration, thread name, attrs), times in seconds; a long-running
+        # server keeps only the latest ``max_spans``
+        self.spans = collections.deque(maxlen=max_spans)
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **attrs):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter(), **attrs)
+
+    def record(self, name, start, end, **attrs):
+        """Adds a span measured elsewhere, with ``time.perf_counter()`` timestamps."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.spans.append((name, start - self._origin, end - start, threading.current_thread().name, attrs))
+
+    def summary(self):
+        """Returns ``{span name: {count, p50_ms, p95_ms, max_ms, total_ms}}``."""
+        durations = {}
+        with self._lock:
+            for name, _, duration, _, _ in self.spans:
+                durations.setdefault(name, []).append(duration * 1000)
+        return {
+            name: {
+                "count": len(values),
+                "p50_ms": round(percentile(values, 0.5), 3),
+                "p95_ms": round(percentile(values, 0.95), 3),
+                "max_ms": round(max(values), 3),
+                "total_ms": round(sum(values), 3),
+            }
+            for name, values in sorted(durations.items())
+        }
+
+    def format_summary(self):
+        lines = [f"{'stage':<24}{'count':>7}{'p50 ms':>11}{'p95 ms':>11}{'total ms':>12}"]
+        for name, stats in self.summary().items():
+            lines.append(f"{name:<24}{stats['count']:>7}{stats['p50_ms']:>11.1f}{stats['p95_ms']:>11.1f}{stats['total_ms']:>12.1f}")
+        return "\n".join(lines)
+
+    def export(self, path):
+        """Writes the spans as a Chrome trace with the summary attached."""
+        with self._lock:
+            spans = list(self.spans)
+        thread_ids = {}
+        events = []
+        for name, start, duration, thread, attrs in spans:
+            events.append({
+                "name": name,
+                "ph": "X",
+                "ts": round(start * 1e6, 1),
+                "dur": round(duration * 1e6, 1),
+                "pid": os.getpid(),
+                "tid": thread_ids.setdefault(thread, len(thread_ids) + 1),
+                "args": {key: str(value) for key, value in attrs.items()},
+            })
+        events.extend(
+            {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": thread}}
+            for thread, tid in thread_ids.items()
+        )
+        with open(path, "w") as fp:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"summary": self.summary()}}, fp)
+
+
+NULL_TRACER = Tracer(enabled=False)
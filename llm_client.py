@@ -0,0 +1,327 @@
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Optional
+
+from interview_trace import NULL_TRACER
+
+
+class LLMError(Exception):
+    """Base class of errors raised by LLMClient."""
+
+
+class LLMTimeoutError(LLMError, TimeoutError):
+    """No attempt finished before the call's deadline."""
+
+
+class LLMBlockedError(LLMError):
+    """The model refused to answer (safety block)."""
+
+
+class LLMEmptyResponseError(LLMError):
+    """The model answered with no content."""
+
+
+class LLMParseError(LLMError, ValueError):
+    """The response matched neither the JSON schema nor the line format."""
+
+
+@dataclass(frozen=True)
+class Feedback:
+    feedback: str
+    follow_up: Optional[str] = None
+
+
+def build_feedback_prompt(question_data, answer, structured=False):
+    """Builds the prompt asking for feedback and one follow-up question.
+
+    ``structured=True`` asks for a JSON object, otherwise for "Feedback:" / "Follow-up:"
+    lines, which can be parsed while the response is still streaming in.
+    """
+    question_text = question_data['text']
+    question_type = question_data['type']
+    expected_format = question_data['format']
+
+    prompt = f"""
+    You are an expert AI Mock Interviewer. Your tone is professional and encouraging.
+    The candidate was asked the following '{question_type}' question:
+    "{question_text}"
+
+    The candidate provided this answer:
+    "{answer}"
+    """
+
+    if expected_format == "STAR":
+        prompt += "\nEvaluate the answer based on the STAR method (Situation, Task, Action, Result). Note if elements seem missing or could be clearer."
+    elif question_type == "Technical":
+        prompt += "\nEvaluate the technical accuracy, depth, and clarity of the explanation."
+    else: # General/Behavioral without specific format
+        prompt += "\nEvaluate the clarity, relevance, and impact of the answer."
+
+    prompt += f"""
+
+    Provide concise, constructive feedback (1-3 sentences).
+    Then, ask ONE relevant follow-up question to probe deeper into their answer or explore a related area. If the answer is too brief or vague for a specific follow-up, ask a related standard question within the same '{question_type}' category.
+    """
+
+    if structured:
+        prompt += """
+    Respond with a JSON object with exactly two string fields, "feedback" and "follow_up".
+    Example:
+    {"feedback": "That's a good start, but perhaps you could elaborate more on the specific results of your actions.", "follow_up": "Can you quantify the impact your contribution had on the project's success?"}
+    """
+    else:
+        prompt += """
+    Start the feedback with "Feedback:" and the follow-up question with "Follow-up:".
+    Ensure your entire response contains ONLY the "Feedback:" line and the "Follow-up:" line.
+    Example:
+    Feedback: That's a good start, but perhaps you could elaborate more on the specific results of your actions.
+    Follow-up: Can you quantify the impact your contribution had on the project's success?
+    """
+    return prompt
+
+
+def parse_feedback(content):
+    """Parses a feedback response: the JSON object first, then the legacy line format."""
+    text = content.strip()
+    if text.startswith("```"):
+        text = text.strip("`").removeprefix("json").strip()
+    try:
+        data = json.loads(text)
+    except ValueError:
+        data = None
+    if isinstance(data, dict):
+        feedback = data.get("feedback")
+        follow_up = data.get("follow_up")
+        if isinstance(feedback, str) and feedback.strip() and (follow_up is None or isinstance(follow_up, str)):
+            return Feedback(feedback.strip(), (follow_up.strip() or None) if follow_up else None)
+        raise LLMParseError(f"JSON response does not match the feedback schema: {text[:200]}")
+
+    feedback = follow_up = None
+    for line in text.split("\n"):
+        key, _, value = line.partition(":")
+        key = key.strip(" *").lower()
+        if key == "feedback" and feedback is None:
+            feedback = value.strip(" *")
+        elif key in ("follow-up", "follow up") and follow_up is None:
+            follow_up = value.strip(" *")
+    if feedback is None and follow_up is None:
+        raise LLMParseError(f"Could not parse feedback from: {text[:200]}")
+    return Feedback(feedback or "Okay.", follow_up or None)
+
+
+_END = object()  # marks an exhausted response stream
+
+
+def is_transient(error):
+    """True for errors worth retrying: timeouts, dropped connections, 429 and 5xx.
+
+    google.api_core errors carry the HTTP status in ``code``; anything else (safety
+    blocks, invalid arguments, auth failures) would fail the same way again.
+    """
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    code = getattr(error, "code", None)
+    return isinstance(code, int) and (code == 429 or code >= 500)
+
+
+def check_response(response):
+    """Raises LLMBlockedError or LLMEmptyResponseError if ``response`` carries no text."""
+    candidates = getattr(response, "candidates", None)
+    if candidates is None or (candidates and candidates[0].content.parts):
+        return
+    block_reason = getattr(getattr(response, "prompt_feedback", None), "block_reason", None)
+    finish_reason = getattr(candidates[0], "finish_reason", None) if candidates else None
+    if not block_reason and getattr(finish_reason, "name", finish_reason) == "SAFETY":
+        block_reason = "SAFETY"
+    if block_reason:
+        raise LLMBlockedError(str(block_reason))
+    raise LLMEmptyResponseError("The model returned an empty response")
+
+
+def _normalize(text):
+    return re.sub(r"\s+", " ", text).strip().strip(".!?").lower()
+
+
+class LLMClient:
+    """Calls a Gemini-style model (anything with ``generate_content(prompt, **kwargs)``).
+
+    Every call gets a deadline. Attempts that fail with a transient error (see
+    ``is_transient``) are retried with exponential backoff while time remains, and if an attempt is still running after ``hedge_after_s`` a
+    second identical request is sent and whichever finishes first wins. Streamed calls
+    get the same deadline and retries, but no hedging. Feedback results are cached by
+    the normalized question and answer.
+    """
+
+    def __init__(
+        self,
+        model,
+        deadline_s=20.0,
+        attempts=3,
+        backoff_s=0.5,
+        hedge_after_s=5.0,
+        cache_size=1024,
+        workers=8,
+        tracer=NULL_TRACER,
+    ):
+        self.model = model
+        self.deadline_s = deadline_s
+        self.attempts = attempts
+        self.backoff_s = backoff_s
+        self.hedge_after_s = hedge_after_s
+        self.cache_size = cache_size
+        self.hedges_sent = 0
+        self.tracer = tracer
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm")
+
+    def generate(self, prompt, deadline_s=None, **kwargs):
+        """Returns the first successful model response, or raises once the deadline has passed."""
+        deadline = time.monotonic() + (deadline_s or self.deadline_s)
+        last_error = None
+        for attempt in range(self.attempts):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                return self._hedged_call(prompt, deadline, kwargs)
+            except LLMTimeoutError:
+                raise
+            except Exception as e:
+                if not is_transient(e):
+                    raise
+                last_error = e
+            time.sleep(min(self.backoff_s * 2 ** attempt, max(0.0, deadline - time.monotonic())))
+        if last_error is not None:
+            raise last_error
+        raise LLMTimeoutError("LLM call exceeded its deadline")
+
+    def _hedged_call(self, prompt, deadline, kwargs):
+        def call():
+            options = dict(kwargs)
+            options.setdefault("request_options", {"timeout": max(1.0, deadline - time.monotonic())})
+            return self.model.generate_content(prompt, **options)
+
+        pending = {self._executor.submit(call)}
+        hedge_at = time.monotonic() + self.hedge_after_s
+        error = None
+        while pending:
+            now = time.monotonic()
+            if now >= deadline:
+                raise LLMTimeoutError("LLM call exceeded its deadline")
+            timeout = deadline - now
+            if len(pending) == 1 and error is None and now < hedge_at:
+                timeout = min(timeout, hedge_at - now)
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+            if not done and len(pending) == 1 and time.monotonic() >= hedge_at:
+                # The first request is slow: race a second one against it.
+                with self._lock:
+                    self.hedges_sent += 1
+                pending.add(self._executor.submit(call))
+                hedge_at = float("inf")
+        raise error
+
+    def stream(self, prompt, deadline_s=None, **kwargs):
+        """Yields the text of a streamed model response as it arrives.
+
+        Attempts that fail transiently before their first chunk are retried with backoff
+        while the deadline allows. After that the caller has already used the text, so
+        errors are raised instead; ``LLMTimeoutError`` is raised when the deadline passes
+        mid-stream. Blocked or empty responses raise LLMBlockedError / LLMEmptyResponseError.
+        """
+        deadline = time.monotonic() + (deadline_s or self.deadline_s)
+
+        def open_stream():
+            options = dict(kwargs)
+            options.setdefault("request_options", {"timeout": max(1.0, deadline - time.monotonic())})
+            chunks = iter(self.model.generate_content(prompt, stream=True, **options))
+            first = next(chunks, _END)
+            if first is _END:
+                raise LLMEmptyResponseError("The model returned an empty response")
+            check_response(first)
+            return chunks, first.text
+
+        last_error = None
+        for attempt in range(self.attempts):
+            if deadline - time.monotonic() <= 0:
+                break
+            try:
+                chunks, text = self._before_deadline(deadline, open_stream)
+            except LLMTimeoutError:
+                raise
+            except Exception as e:
+                if not is_transient(e):
+                    raise
+                last_error = e
+                time.sleep(min(self.backoff_s * 2 ** attempt, max(0.0, deadline - time.monotonic())))
+                continue
+            while True:
+                if text:
+                    yield text
+                chunk = self._before_deadline(deadline, next, chunks, _END)
+                if chunk is _END:
+                    return
+                try:
+                    check_response(chunk)
+                    text = chunk.text
+                except LLMEmptyResponseError:
+                    text = ""  # a closing chunk may carry only the finish reason
+        if last_error is not None:
+            raise last_error
+        raise LLMTimeoutError("LLM call exceeded its deadline")
+
+    def _before_deadline(self, deadline, fn, *args):
+        """Runs ``fn`` on the pool and waits for it until ``deadline``."""
+        future = self._executor.submit(fn, *args)
+        try:
+            return future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            raise LLMTimeoutError("LLM call exceeded its deadline") from None
+
+    def feedback(self, question_data, answer, deadline_s=None):
+        """Returns validated Feedback for an answer, from the cache when possible."""
+        key = self.cache_key(question_data, answer)
+        cached = self.cached(key)
+        if cached is not None:
+            return cached
+
+        with self.tracer.span("llm"):
+            response = self.generate(
+                build_feedback_prompt(question_data, answer, structured=True),
+                deadline_s=deadline_s,
+                generation_config={"response_mime_type": "application/json"},
+            )
+        check_response(response)
+
+        with self.tracer.span("parse"):
+            result = parse_feedback(response.text)
+        self.remember(key, result)
+        return result
+
+    @staticmethod
+    def cache_key(question_data, answer):
+        return (question_data['type'], question_data['format'], _normalize(question_data['text']), _normalize(answer))
+
+    def cached(self, key):
+        with self._lock:
+            result = self._cache.get(key)
+            if result is not None:
+                self._cache.move_to_end(key)
+            return result
+
+    def remember(self, key, result):
+        with self._lock:
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
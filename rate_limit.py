@@ -0,0 +1,19 @@
+import time
+import threading
+
+
+class RateLimiter:
+    """Spaces out calls so that at most ``calls`` start per ``period`` seconds, across threads."""
+
+    def __init__(self, calls, period=60.0):
+        self.interval = period / calls
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
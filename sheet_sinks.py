@@ -0,0 +1,65 @@
+import csv
+
+
+class CsvSink:
+    """Appends columnar batches (``{column: [values]}``) to a CSV file as they arrive."""
+
+    def __init__(self, path, columns):
+        self.columns = list(columns)
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self.columns)
+
+    def write(self, batch):
+        self._writer.writerows(zip(*(batch[column] for column in self.columns)))
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ParquetSink:
+    """Appends columnar batches to a Parquet file, one row group per batch."""
+
+    def __init__(self, path, columns, compression="snappy"):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("ParquetSink needs pyarrow: pip install pyarrow") from e
+        self._pa = pa
+        self.columns = list(columns)
+        self._schema = pa.schema([(column, pa.string()) for column in self.columns])
+        self._writer = pq.ParquetWriter(path, self._schema, compression=compression)
+
+    def write(self, batch):
+        arrays = [self._pa.array(batch[column], type=self._pa.string()) for column in self.columns]
+        self._writer.write_table(self._pa.Table.from_arrays(arrays, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def write_batches(batches, *sinks):
+    """Feeds every batch to every sink, closing the sinks at the end; returns the row count."""
+    rows = 0
+    try:
+        for batch in batches:
+            for sink in sinks:
+                sink.write(batch)
+            rows += len(next(iter(batch.values()), []))
+    finally:
+        for sink in sinks:
+            sink.close()
+    return rows
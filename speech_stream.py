@@ -0,0 +1,251 @@
+import json
+import math
+import time
+import wave
+import array
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+import speech_recognition as sr
+
+from interview_trace import NULL_TRACER
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2  # 16-bit PCM
+FRAME_MS = 30
+
+
+def frame_rms(frame):
+    """Root mean square energy of a 16-bit little-endian PCM frame."""
+    samples = array.array("h", frame)
+    if not samples:
+        return 0.0
+    return math.sqrt(sum(sample * sample for sample in samples) / len(samples))
+
+
+# --- Audio sources ---
+# A source is a context manager exposing ``sample_rate``, ``live`` (True for a microphone)
+# and a ``frames()`` iterator of FRAME_MS-long mono 16-bit PCM frames.
+
+class MicrophoneSource:
+    """Frames read live from the default microphone."""
+
+    live = True
+
+    def __init__(self, sample_rate=SAMPLE_RATE, frame_ms=FRAME_MS):
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+        self._microphone = sr.Microphone(sample_rate=sample_rate, chunk_size=sample_rate * frame_ms // 1000)
+        self._source = None
+
+    def __enter__(self):
+        self._source = self._microphone.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._microphone.__exit__(exc_type, exc_val, exc_tb)
+
+    def frames(self):
+        while True:
+            yield self._source.stream.read(self._source.CHUNK)
+
+
+class WavFileSource:
+    """Frames read from a mono 16-bit WAV file, for tests and benchmarks without a microphone."""
+
+    live = False
+
+    def __init__(self, path, frame_ms=FRAME_MS):
+        self.path = path
+        self.frame_ms = frame_ms
+        self._wav = None
+        self.sample_rate = None
+
+    def __enter__(self):
+        self._wav = wave.open(self.path, "rb")
+        if self._wav.getnchannels() != 1 or self._wav.getsampwidth() != SAMPLE_WIDTH:
+            self._wav.close()
+            raise ValueError(f"{self.path} must be mono 16-bit PCM")
+        self.sample_rate = self._wav.getframerate()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._wav.close()
+
+    def frames(self):
+        samples_per_frame = self.sample_rate * self.frame_ms // 1000
+        while True:
+            frame = self._wav.readframes(samples_per_frame)
+            if not frame:
+                return
+            yield frame
+
+
+# --- Recognition backends ---
+# A backend turns one PCM segment into text ("" if it heard no words).
+
+class GoogleBackend:
+    """Google Web Speech API through speech_recognition (needs network)."""
+
+    def __init__(self, language="en-US"):
+        self.language = language
+        self._recognizer = sr.Recognizer()
+
+    def transcribe(self, pcm, sample_rate):
+        try:
+            return self._recognizer.recognize_google(sr.AudioData(pcm, sample_rate, SAMPLE_WIDTH), language=self.language)
+        except sr.UnknownValueError:
+            return ""
+
+
+class VoskBackend:
+    """Offline recognition with a local Vosk model (https://alphacephei.com/vosk/models)."""
+
+    def __init__(self, model_path):
+        try:
+            from vosk import Model, KaldiRecognizer
+        except ImportError as e:
+            raise ImportError("VoskBackend needs vosk: pip install vosk") from e
+        self._model = Model(model_path)
+        self._recognizer_class = KaldiRecognizer
+
+    def transcribe(self, pcm, sample_rate):
+        recognizer = self._recognizer_class(self._model, sample_rate)
+        recognizer.AcceptWaveform(pcm)
+        return json.loads(recognizer.FinalResult()).get("text", "")
+
+
+def make_backend(name, **options):
+    """Builds a backend by name: "google" or "vosk" (needs ``model_path``)."""
+    if name == "google":
+        return GoogleBackend(**options)
+    if name == "vosk":
+        return VoskBackend(**options)
+    raise ValueError(f"Unknown speech backend: {name}")
+
+
+class StreamingListener:
+    """Records a phrase frame by frame and transcribes it while the speaker is still talking.
+
+    An energy-based voice activity detector cuts the phrase into segments at short
+    pauses; each finished segment is transcribed in the background, so when the speaker
+    stops only the last segment is left to recognize. The noise floor is measured once
+    with ``calibrate_source`` on ambient audio and reused for every live source; until
+    then, and for recordings, ``min_energy`` is the speech threshold.
+    """
+
+    def __init__(
+        self,
+        backend,
+        pause_ms=1200,
+        segment_pause_ms=300,
+        min_segment_ms=3000,
+        timeout_s=7,
+        phrase_limit_s=45,
+        calibration_ms=500,
+        energy_factor=1.5,
+        noise_percentile=20,
+        min_energy=300,
+        workers=2,
+        tracer=NULL_TRACER,
+    ):
+        self.backend = backend
+        self.pause_ms = pause_ms
+        self.segment_pause_ms = segment_pause_ms
+        self.min_segment_ms = min_segment_ms
+        self.timeout_s = timeout_s
+        self.phrase_limit_s = phrase_limit_s
+        self.calibration_ms = calibration_ms
+        self.energy_factor = energy_factor
+        self.noise_percentile = noise_percentile
+        self.min_energy = min_energy
+        self.energy_threshold = None
+        self.tracer = tracer
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="stt")
+
+    def calibrate(self, frames):
+        """Sets the speech threshold from frames of background noise.
+
+        The noise floor is a low percentile of the frame energies, so a cough or the
+        first words of an answer inside the sample do not raise it.
+        """
+        energies = sorted(frame_rms(frame) for frame in frames)
+        ambient = energies[len(energies) * self.noise_percentile // 100] if energies else 0.0
+        self.energy_threshold = max(self.min_energy, ambient * self.energy_factor)
+        return self.energy_threshold
+
+    def calibrate_source(self, source):
+        """Calibrates from ``calibration_ms`` of an open source; call it while nobody is answering."""
+        with self.tracer.span("listen.calibrate"):
+            frames = source.frames()
+            return self.calibrate([frame for _, frame in zip(range(self.calibration_ms // source.frame_ms), frames)])
+
+    def listen(self, source, on_partial=None):
+        """Returns the text of the next phrase from ``source``.
+
+        Raises ``sr.WaitTimeoutError`` if nobody speaks within ``timeout_s`` and
+        ``sr.UnknownValueError`` if speech was heard but no words were recognized.
+        ``on_partial`` receives the text of each segment as soon as it is transcribed.
+        """
+        frame_ms = source.frame_ms
+        frames = source.frames()
+        # The session's noise floor describes the microphone's room, not a recording
+        threshold = self.energy_threshold if source.live and self.energy_threshold is not None else self.min_energy
+
+        pre_roll = collections.deque(maxlen=max(1, 300 // frame_ms))  # keep word onsets
+        segments = []
+        segment = None
+        segment_has_speech = False
+        waited_ms = silence_ms = segment_ms = phrase_ms = 0
+
+        def close_segment():
+            pcm = b"".join(segment)
+            future = self._executor.submit(transcribe, pcm)
+            if on_partial:
+                future.add_done_callback(report_partial)
+            segments.append(future)
+
+        def transcribe(pcm):
+            with self.tracer.span("recognize.segment", audio_ms=len(pcm) * 1000 // (SAMPLE_WIDTH * source.sample_rate)):
+                return self.backend.transcribe(pcm, source.sample_rate)
+
+        def report_partial(future):
+            if future.exception() is None and future.result():
+                on_partial(future.result())
+
+        capture_start = time.perf_counter()
+        for frame in frames:
+            is_speech = frame_rms(frame) >= threshold
+            if segment is None and not segments:
+                if not is_speech:
+                    pre_roll.append(frame)
+                    waited_ms += frame_ms
+                    if waited_ms >= self.timeout_s * 1000:
+                        raise sr.WaitTimeoutError("listening timed out while waiting for phrase to start")
+                    continue
+                segment = list(pre_roll)
+            elif segment is None:
+                segment = []
+            segment.append(frame)
+            segment_has_speech = segment_has_speech or is_speech
+            segment_ms += frame_ms
+            phrase_ms += frame_ms
+            silence_ms = 0 if is_speech else silence_ms + frame_ms
+
+            if silence_ms >= self.pause_ms or phrase_ms >= self.phrase_limit_s * 1000:
+                break
+            if segment_ms >= self.min_segment_ms and silence_ms >= self.segment_pause_ms:
+                close_segment()
+                segment, segment_ms, segment_has_speech = None, 0, False
+
+        if segment and segment_has_speech:
+            close_segment()
+        self.tracer.record("listen.capture", capture_start, time.perf_counter(), phrase_ms=phrase_ms, segments=len(segments))
+        if not segments:
+            raise sr.WaitTimeoutError("audio ended before a phrase started")
+        # Only the recognition still running after the speaker stopped adds to the turn's latency
+        with self.tracer.span("recognize", segments=len(segments)):
+            text = " ".join(part for part in (future.result() for future in segments) if part).strip()
+        if not text:
+            raise sr.UnknownValueError()
+        return text
@@ -0,0 +1,99 @@
+import os
+import hashlib
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from gtts import gTTS
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "ai_interview", "tts")
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+
+class AudioCache:
+    """Content-addressed on-disk cache of synthesized speech.
+
+    Files are named by a hash of (text, language, voice), so a phrase is synthesized
+    once and then played straight from disk. When the cache grows past ``max_bytes``
+    the least recently used files are deleted.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, lang="en", tld="com", workers=4):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lang = lang
+        self.tld = tld  # gTTS "voice": the Google domain selects the accent
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._in_flight = {}  # path -> Future, so concurrent requests synthesize once
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tts")
+        self._sizes = {}
+        for entry in os.scandir(cache_dir):
+            if entry.name.endswith(".mp3"):
+                self._sizes[entry.path] = entry.stat().st_size
+        self._total = sum(self._sizes.values())
+
+    def path_for(self, text, lang=None, tld=None):
+        key = "\0".join((lang or self.lang, tld or self.tld, text))
+        return os.path.join(self.cache_dir, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".mp3")
+
+    def get(self, text, lang=None, tld=None):
+        """Returns the path of the audio for ``text``, synthesizing it first if needed."""
+        return self.fetch(text, lang, tld).result()
+
+    def fetch(self, text, lang=None, tld=None):
+        """Returns a Future for the audio path; a cache hit is already resolved."""
+        path = self.path_for(text, lang, tld)
+        with self._lock:
+            if path in self._sizes:
+                try:
+                    os.utime(path)  # mtime is the LRU clock
+                except FileNotFoundError:
+                    self._forget(path)
+                else:
+                    future = Future()
+                    future.set_result(path)
+                    return future
+            future = self._in_flight.get(path)
+            if future is None:
+                future = self._executor.submit(self._synthesize, text, lang or self.lang, tld or self.tld, path)
+                self._in_flight[path] = future
+            return future
+
+    def prefetch(self, texts, lang=None, tld=None):
+        """Starts synthesizing every text that is not cached yet, without waiting."""
+        return [self.fetch(text, lang, tld) for text in texts if text]
+
+    def _synthesize(self, text, lang, tld, path):
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            gTTS(text=text, lang=lang, tld=tld, slow=False).save(temp_path)
+            os.replace(temp_path, path)
+            with self._lock:
+                size = os.path.getsize(path)
+                self._total += size - self._sizes.get(path, 0)
+                self._sizes[path] = size
+                self._evict(keep=path)
+            return path
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            with self._lock:
+                self._in_flight.pop(path, None)
+
+    def _evict(self, keep):
+        if self._total <= self.max_bytes:
+            return
+        by_age = sorted(self._sizes, key=lambda p: os.path.getmtime(p) if os.path.exists(p) else 0)
+        for path in by_age:
+            if self._total <= self.max_bytes:
+                break
+            if path == keep or path in self._in_flight:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._forget(path)
+
+    def _forget(self, path):
+        self._total -= self._sizes.pop(path, 0)
@@ -0,0 +1,109 @@
+import os
+import json
+import time
+import atexit
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+
+class SignedURLCache:
+    """In-process LRU cache of signed URLs that knows when each URL expires.
+
+    A cached URL is handed out again only while more than ``safety_margin``
+    seconds of its lifetime remain, so callers never receive a URL that is
+    about to stop working. For URLs that live less than twice the margin, the
+    margin shrinks to half their lifetime, so short-lived URLs are still reused.
+    With ``path`` set, unexpired entries are loaded from that JSON file and
+    written back on ``save()`` and at interpreter exit.
+    """
+
+    def __init__(self, max_entries: int = 10000, safety_margin: float = 300, path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.safety_margin = safety_margin
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (url, fresh_until): expiry minus the margin
+        self._lock = threading.Lock()
+        if path:
+            self._load()
+            atexit.register(self.save)
+
+    def get(self, key: Hashable) -> Optional[str]:
+        """Returns the cached URL for ``key`` if it is still safely valid."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            url, fresh_until = entry
+            if fresh_until <= time.time():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return url
+
+    def put(self, key: Hashable, url: str, expires_at: float) -> None:
+        """Stores a URL that stops working at the unix time ``expires_at``."""
+        lifetime = expires_at - time.time()
+        fresh_until = expires_at - min(self.safety_margin, max(0.0, lifetime) / 2)
+        with self._lock:
+            self._entries[key] = (url, fresh_until)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_sign(self, key: Hashable, lifetime: float, sign: Callable[[], str]) -> str:
+        """Returns a cached URL for ``key`` or calls ``sign`` for one valid ``lifetime`` seconds."""
+        url = self.get(key)
+        if url is None:
+            expires_at = time.time() + lifetime
+            url = sign()
+            self.put(key, url, expires_at)
+        return url
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and the current size."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._entries),
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def save(self) -> None:
+        """Writes the unexpired entries to ``path``."""
+        if not self.path:
+            return
+        now = time.time()
+        with self._lock:
+            entries = [[list(key) if isinstance(key, tuple) else key, url, fresh_until]
+                       for key, (url, fresh_until) in self._entries.items()
+                       if fresh_until > now]
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as fp:
+            json.dump(entries, fp)
+        os.replace(tmp_path, self.path)
+
+    def _load(self):
+        try:
+            with open(self.path) as fp:
+                entries = json.load(fp)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        for key, url, fresh_until in entries[-self.max_entries:]:
+            if fresh_until > now:
+                # JSON turns tuple keys into lists; restore them so lookups match.
+                self._entries[tuple(key) if isinstance(key, list) else key] = (url, fresh_until)
+
+    def __len__(self) -> int:
+        return len(self._entries)